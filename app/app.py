@@ -1,10 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from app.models import Database
 from app.config import Config
 from app.seed_manager import SeedManager
+from app.metrics import registry, http_request_seconds
+from app.statistics import StatisticsService
+from app.serialization import GeoDishJSONProvider, RawJSON, encode_document
+from app.singleflight import SingleFlightTimeout
+from app.logs import LogPipeline, parse_sample_rates
+from app.assets import BUILD_DIR, IndexPage, build_assets, is_fingerprinted, precompressed_variant
+from app.profiling import (PROFILE_HEADER, CaptureStore, RequestProfiler, sign_profile_token,
+                           verify_profile_token)
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import safe_join
+import click
+import hashlib
+import itertools
+import json
 import logging
+import mimetypes
 import os
+import threading
+import time
 
 # Fix static folder path for container
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,32 +32,209 @@ static_folder = os.path.join(os.path.dirname(current_dir), 'static')
 
 app = Flask(__name__, static_folder=static_folder, static_url_path='/static')
 app.config.from_object(Config)
+app.json = GeoDishJSONProvider(app)
 CORS(app)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging: records are filtered and queued here, formatted and written by a
+# background thread (the app is imported after gunicorn forks, so one per worker)
+log_pipeline = LogPipeline(
+    level=Config.LOG_LEVEL,
+    json_format=Config.LOG_FORMAT == 'json',
+    sample_rate=Config.LOG_SAMPLE_RATE,
+    route_rates=parse_sample_rates(Config.LOG_ROUTE_SAMPLE_RATES),
+    error_rate=Config.LOG_ERROR_RATE_PER_SECOND,
+    queue_size=Config.LOG_QUEUE_SIZE
+).install()
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('geodish.access')
 
 # Initialize database and seed manager
 db = Database()
 seed_manager = SeedManager(db)
+# The first refresh may wait out server selection before failing, so allow for that
+statistics = StatisticsService(db, interval=Config.STATS_REFRESH_SECONDS,
+                               wait_timeout=Config.SINGLE_FLIGHT_TIMEOUT_SECONDS + db.server_selection_timeout)
+
+# Catalog gauges are read from the in-process catalog cache at scrape time
+registry.gauge('geodish_dishes', 'Number of dishes in the catalog', db.get_total_dish_count)
+registry.gauge('geodish_countries', 'Number of countries in the catalog', lambda: len(db.get_countries()))
+registry.gauge('geodish_catalog_version', 'Shared catalog version as last seen by this process', lambda: db.catalog_version)
+registry.gauge(
+    'geodish_country_dishes', 'Number of dishes per country',
+    lambda: [((country,), count) for country, count in db.get_country_dish_counts().items()],
+    label_names=('country',)
+)
+registry.counter(
+    'geodish_recipe_cache_events_total', 'Per-user recipe cache lookups and evictions in this process',
+    lambda: [((event,), db.recipe_cache.stats()[event]) for event in ('hits', 'misses', 'evictions')],
+    label_names=('event',)
+)
+registry.counter(
+    'geodish_single_flight_calls_total', 'Coalesced MongoDB reads: executed, shared with a waiter, or timed out',
+    lambda: [((outcome,), count) for outcome, count in db.flights.stats().items()],
+    label_names=('outcome',)
+)
+registry.counter(
+    'geodish_log_records_discarded_total', 'Log records not written: sampled out, rate limited or queue full',
+    lambda: [((reason,), log_pipeline.stats()[reason]) for reason in ('sampled_out', 'suppressed', 'dropped')],
+    label_names=('reason',)
+)
+registry.gauge('geodish_recipe_cache_recipes', 'Recipe documents held in the per-user recipe cache',
+               lambda: db.recipe_cache.stats()['recipes'])
+registry.gauge('geodish_users', 'Users with saved recipes (background snapshot)',
+               lambda: statistics.snapshot()['total_users'])
+registry.gauge('geodish_saved_recipes', 'Saved recipes, estimated (background snapshot)',
+               lambda: statistics.snapshot()['saved_recipes'])
+
+def warm_up():
+    """Prepare this worker in the background: indexes, catalog caches, statistics.
+
+    Runs on its own thread so a large catalog cannot delay the worker's
+    heartbeat; requests arriving meanwhile load what they need on demand.
+    """
+    thread = threading.Thread(target=_warm_up, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+def _warm_up():
+    try:
+        db.ensure_indexes()
+    except Exception as e:
+        # Missing indexes slow queries down but must not keep the caches cold
+        logger.warning("Creating indexes failed: %s", e)
+    statistics.start()
+    try:
+        started = time.perf_counter()
+        loaded = db.warm_up()
+        logger.info("Worker %s warmed up with %s dishes in %.1fs%s", os.getpid(), db.get_total_dish_count(),
+                    time.perf_counter() - started, "" if loaded else " (catalog indexes load on first use)")
+    except Exception as e:
+        logger.warning("Warmup failed, caches will load on first request: %s", e)
+
+def shut_down():
+    """Release per-worker resources once in-flight requests have drained"""
+    statistics.stop()
+    batch_pool.shutdown(wait=True)
+    db.close()
+    log_pipeline.stop()
+
+# Request latency instrumentation
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        elapsed = time.perf_counter() - started
+        http_request_seconds.observe(elapsed, request.method, route, str(response.status_code))
+        # Sampled per route like any other success log; the JSON formatter adds the extras
+        access_logger.info("%s %s %s", request.method, request.path, response.status_code,
+                           extra={"status": response.status_code, "duration_ms": round(elapsed * 1000, 2)})
+    return response
+
+# Request profiling: MongoDB timelines of slow requests, stack samples on request
+profiler = RequestProfiler(
+    CaptureStore(Config.PROFILE_DIR, Config.PROFILE_MAX_CAPTURES),
+    slow_ms=Config.PROFILE_SLOW_REQUEST_MS,
+    profile_all=Config.PROFILE_ALL_REQUESTS,
+    secret=Config.PROFILE_SECRET,
+    interval=Config.PROFILE_SAMPLE_INTERVAL_MS / 1000
+)
+
+@app.before_request
+def start_request_profile():
+    g.profile = profiler.begin(request.headers.get(PROFILE_HEADER))
+
+@app.after_request
+def finish_request_profile(response):
+    capture = g.pop('profile', None)
+    if capture is not None:
+        method, path = request.method, request.path
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        if capture.profiled:
+            response.headers['X-GeoDish-Profile-Id'] = capture.id
+        # Streamed bodies are still being encoded after this hook, so stop once the body is sent
+        response.call_on_close(lambda: profiler.end(capture, method, route, path, response.status_code))
+    return response
+
+@app.teardown_request
+def abandon_request_profile(error):
+    # after_request did not run (unhandled error): stop the sampler, keep what was recorded
+    capture = g.pop('profile', None)
+    if capture is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        profiler.end(capture, request.method, route, request.path, 500)
+
+# Conditional GET: ETags are derived from versions, so a 304 needs no query or JSON encoding
+CATALOG_CACHE_CONTROL = f"public, max-age={Config.CATALOG_CACHE_MAX_AGE}"
+USER_CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+def with_cache_headers(response, etag, cache_control, weak=False):
+    response.set_etag(etag, weak=weak)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def not_modified(etag, cache_control, weak=False):
+    """304 response if the client's If-None-Match already matches etag, else None"""
+    # Weak comparison: nginx turns strong ETags weak when it gzips a response
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return with_cache_headers(Response(status=304), etag, cache_control, weak)
+
+# Root route to serve HTML from memory (static/dist/index.html after `flask build-assets`)
+index_page = IndexPage(static_folder)
+# The page names hashed asset files, so it must be revalidated but may be stored
+INDEX_CACHE_CONTROL = "no-cache"
 
-# Root route to serve HTML
 @app.route('/', methods=['GET'])
 def index():
     """Serve the main GeoDish application page"""
     try:
-        index_path = os.path.join(static_folder, 'index.html')
-        logger.info(f"Serving index.html from: {index_path}")
-        logger.info(f"Static folder: {static_folder}")
-        logger.info(f"Files in static: {os.listdir(static_folder) if os.path.exists(static_folder) else 'NOT FOUND'}")
-        
-        if os.path.exists(index_path):
-            return app.send_static_file('index.html')
-        else:
-            return jsonify({"error": f"index.html not found at {index_path}"}), 500
+        if index_page.body is None:
+            return jsonify({"error": f"index.html not found in {static_folder}"}), 500
+        # The gzipped copy is a different representation, so it gets its own ETag
+        gzipped = 'gzip' in request.accept_encodings
+        etag = index_page.etag + ('-gz' if gzipped else '')
+        cached = not_modified(etag, INDEX_CACHE_CONTROL)
+        if cached:
+            cached.vary.add('Accept-Encoding')
+            return cached
+        response = Response(index_page.gzipped if gzipped else index_page.body, mimetype='text/html')
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return with_cache_headers(response, etag, INDEX_CACHE_CONTROL), 200
     except Exception as e:
-        logger.error(f"Error serving index page: {str(e)}")
+        logger.error("Error serving index page: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+# Fingerprinted names change with their content, so those files may be cached forever
+DIST_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@app.route('/static/dist/<path:filename>', methods=['GET'])
+def built_asset(filename):
+    """Serve `flask build-assets` output, sending the .br/.gz sibling the client accepts"""
+    try:
+        path = safe_join(os.path.join(static_folder, BUILD_DIR), filename)
+        if path is None or not os.path.isfile(path):
+            return jsonify({"error": "Not found"}), 404
+        variant, encoding = precompressed_variant(path, request.accept_encodings)
+        # The type is the original file's, not application/gzip
+        response = send_file(variant, mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # manifest.json and the built index.html keep their names, so they are revalidated
+        response.headers['Cache-Control'] = DIST_CACHE_CONTROL if is_fingerprinted(filename) else INDEX_CACHE_CONTROL
+        return response
+    except Exception as e:
+        logger.error("Error serving built asset %s: %s", filename, e)
         return jsonify({"error": str(e)}), 500
 
 # Countries endpoint
@@ -46,38 +242,243 @@ def index():
 def get_countries_route():
     """Get list of all available countries"""
     try:
+        etag = db.catalog_etag
+        cached = not_modified(etag, CATALOG_CACHE_CONTROL)
+        if cached:
+            return cached
         countries = db.get_countries()
-        logger.info(f"Found {len(countries)} countries")
-        return jsonify(countries), 200
+        logger.info("Found %s countries", len(countries))
+        return with_cache_headers(jsonify(countries), etag, CATALOG_CACHE_CONTROL), 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error getting countries: {str(e)}")
+        logger.error("Error getting countries: %s", e)
         return jsonify({"error": str(e)}), 500
 
 # User recipes endpoint
+MAX_RECIPES_PAGE = 500
+
+def stream_recipes(recipes, limit, paginated):
+    """Encode recipes into a JSON response body one document at a time.
+
+    Paginated responses are wrapped as {"recipes": [...], "next_after": id};
+    limit + 1 documents are requested so the extra one only signals a next page.
+    Pre-encoded dish payloads are spliced in rather than encoded again.
+    """
+    yield '{"recipes": [' if paginated else '['
+    count = 0
+    last_id = None
+    has_more = False
+    for recipe in recipes:
+        if limit is not None and count == limit:
+            has_more = True
+            break
+        yield (',' if count else '') + encode_document(recipe)
+        last_id = recipe['_id']
+        count += 1
+    if paginated:
+        yield '], "next_after": ' + app.json.dumps(last_id if has_more else None) + '}'
+    else:
+        yield ']'
+
 @app.route('/user/<user_id>/recipes/full', methods=['GET'])
 def get_user_recipes_full(user_id):
-    """Get full details of user's recipes"""
+    """Get full details of user's recipes, optionally paged with ?after=<id>&limit=N&fields=a,b"""
     try:
-        recipes = db.get_user_recipes(user_id)
-        logger.info(f"Found {len(recipes)} recipes for user {user_id}")
-        return jsonify(recipes), 200
+        after = request.args.get('after')
+        limit_param = request.args.get('limit')
+        fields = [field for field in request.args.get('fields', '').split(',') if field]
+
+        if after and not ObjectId.is_valid(after):
+            return jsonify({"error": "after must be a recipe ID"}), 400
+        limit = None
+        if limit_param is not None:
+            try:
+                limit = int(limit_param)
+            except ValueError:
+                return jsonify({"error": "limit must be an integer"}), 400
+            if limit < 1 or limit > MAX_RECIPES_PAGE:
+                return jsonify({"error": f"limit must be between 1 and {MAX_RECIPES_PAGE}"}), 400
+
+        # Hydrated recipes also depend on the catalog; the query string selects the page
+        version = db.get_user_recipes_version(user_id)
+        etag = make_etag(version, db.catalog_etag, db.recipe_storage, request.query_string.decode())
+        cached = not_modified(etag, USER_CACHE_CONTROL)
+        if cached:
+            return cached
+
+        recipes = db.iter_user_recipes(
+            user_id,
+            after=after,
+            limit=limit + 1 if limit else None,
+            fields=fields or None,
+            encoded_dishes=True,
+            version=version
+        )
+        # Pull the first document now so database errors still produce a 500
+        first = next(recipes, None)
+        if first is not None:
+            recipes = itertools.chain([first], recipes)
+
+        paginated = limit is not None or bool(after)
+        response = Response(stream_recipes(recipes, limit, paginated), mimetype='application/json')
+        return with_cache_headers(response, etag, USER_CACHE_CONTROL), 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error getting detailed recipes for {user_id}: {str(e)}")
+        logger.error("Error getting detailed recipes for %s: %s", user_id, e)
         return jsonify({"error": str(e)}), 500
 
 # Random dish by country
+MAX_DISH_SAMPLE = 20
+# Every request is a fresh random pick, so neither browsers nor nginx may replay one
+DISH_CACHE_CONTROL = "no-store"
+
 @app.route('/dish/<country>', methods=['GET'])
 def get_random_dish(country):
-    """Get a random dish from a specific country"""
+    """Get a random dish from a specific country, or several with ?count=N&exclude=id1,id2"""
     try:
-        dish = db.get_random_dish_by_country(country)
-        if dish:
-            logger.info(f"Found dish: {dish['name']} from {country}")
-            return jsonify(dish), 200
-        else:
+        count_param = request.args.get('count')
+        exclude = [dish_id for dish_id in request.args.get('exclude', '').split(',') if dish_id]
+
+        try:
+            count = int(count_param) if count_param is not None else 1
+        except ValueError:
+            return jsonify({"error": "count must be an integer"}), 400
+        if count < 1 or count > MAX_DISH_SAMPLE:
+            return jsonify({"error": f"count must be between 1 and {MAX_DISH_SAMPLE}"}), 400
+
+        # Dishes come back as cached pre-encoded JSON, joined without re-encoding
+        payloads = db.get_random_dish_payloads(country, count, exclude)
+        if not payloads:
             return jsonify({"error": f"No dishes found for country: {country}"}), 404
+        logger.info("Sampled %s dishes from %s", len(payloads), country)
+        body = payloads[0] if count_param is None else '[' + ','.join(payloads) + ']'
+        response = Response(body, mimetype='application/json')
+        response.headers['Cache-Control'] = DISH_CACHE_CONTROL
+        return response, 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error getting dish for {country}: {str(e)}")
+        logger.error("Error getting dish for %s: %s", country, e)
+        return jsonify({"error": str(e)}), 500
+
+# Similar dishes
+@app.route('/dish/<dish_id>/similar', methods=['GET'])
+def get_similar_dishes(dish_id):
+    """Dishes from other countries with the most similar ingredients (?limit=N)"""
+    try:
+        try:
+            limit = int(request.args.get('limit', Config.SIMILAR_DISHES_K))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        if limit < 1 or limit > Config.SIMILAR_DISHES_K:
+            return jsonify({"error": f"limit must be between 1 and {Config.SIMILAR_DISHES_K}"}), 400
+
+        etag = make_etag(db.catalog_etag, dish_id, limit)
+        cached = not_modified(etag, CATALOG_CACHE_CONTROL)
+        if cached:
+            return cached
+
+        neighbors = db.get_similar_dishes(dish_id, limit)
+        if neighbors is None:
+            return jsonify({"error": "Dish not found"}), 404
+        payloads = db.get_dish_payloads([neighbor_id for neighbor_id, _ in neighbors])
+        similar = ','.join(
+            encode_document({"score": score, "dish": payloads[neighbor_id]})
+            for neighbor_id, score in neighbors if neighbor_id in payloads
+        )
+        body = f'{{"dish_id":{app.json.dumps(dish_id)},"similar":[{similar}]}}'
+        return with_cache_headers(Response(body, mimetype='application/json'), etag, CATALOG_CACHE_CONTROL), 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error("Error getting dishes similar to %s: %s", dish_id, e)
+        return jsonify({"error": str(e)}), 500
+
+# Dish search
+MAX_SEARCH_RESULTS = 50
+
+@app.route('/search', methods=['GET'])
+def search_dishes():
+    """Search dishes: ?q=text&ingredient=name (repeatable)&country=name&limit=N&offset=N"""
+    try:
+        query = request.args.get('q', '')
+        ingredients = request.args.getlist('ingredient')
+        country = request.args.get('country')
+        if not (query.strip() or any(ingredient.strip() for ingredient in ingredients) or country):
+            return jsonify({"error": "q, ingredient or country is required"}), 400
+        try:
+            limit = int(request.args.get('limit', 20))
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({"error": "limit and offset must be integers"}), 400
+        if limit < 1 or limit > MAX_SEARCH_RESULTS:
+            return jsonify({"error": f"limit must be between 1 and {MAX_SEARCH_RESULTS}"}), 400
+        if offset < 0:
+            return jsonify({"error": "offset must not be negative"}), 400
+
+        etag = make_etag(db.catalog_etag, request.query_string.decode())
+        cached = not_modified(etag, CATALOG_CACHE_CONTROL)
+        if cached:
+            return cached
+
+        total, dish_ids = db.search_dishes(query, ingredients, country, offset, limit)
+        payloads = db.get_dish_payloads(dish_ids)
+        results = ','.join(payloads[dish_id] for dish_id in dish_ids if dish_id in payloads)
+        body = (f'{{"total":{total},"offset":{offset},"limit":{limit},'
+                f'"results":[{results}]}}')
+        return with_cache_headers(Response(body, mimetype='application/json'), etag, CATALOG_CACHE_CONTROL), 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error("Error searching dishes: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+# Cook with what I have
+MAX_PANTRY_ITEMS = 200
+MAX_PANTRY_RESULTS = 50
+
+@app.route('/pantry', methods=['POST'])
+def match_pantry():
+    """Rank dishes by how much of them a pantry covers.
+
+    Body: {"ingredients": ["rice", "eggs"], "limit": 10, "max_missing": 2}
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('ingredients'), list):
+            return jsonify({"error": "ingredients list is required"}), 400
+        pantry = data['ingredients']
+        if not pantry or not all(isinstance(item, str) for item in pantry):
+            return jsonify({"error": "ingredients must be a non-empty list of strings"}), 400
+        if len(pantry) > MAX_PANTRY_ITEMS:
+            return jsonify({"error": f"At most {MAX_PANTRY_ITEMS} ingredients per request"}), 400
+        limit = data.get('limit', 10)
+        max_missing = data.get('max_missing')
+        if not isinstance(limit, int) or limit < 1 or limit > MAX_PANTRY_RESULTS:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PANTRY_RESULTS}"}), 400
+        if max_missing is not None and (not isinstance(max_missing, int) or max_missing < 0):
+            return jsonify({"error": "max_missing must be a non-negative integer"}), 400
+
+        candidates, matches = db.match_pantry(pantry, limit, max_missing)
+        payloads = db.get_dish_payloads([match['dish_id'] for match in matches])
+        results = ','.join(
+            encode_document(dict(match, dish=payloads[match['dish_id']]))
+            for match in matches if match['dish_id'] in payloads
+        )
+        logger.info("Pantry of %s ingredients matched %s dishes", len(pantry), candidates)
+        return Response(f'{{"candidates":{candidates},"results":[{results}]}}', mimetype='application/json'), 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error("Error matching pantry: %s", e)
         return jsonify({"error": str(e)}), 500
 
 # Save dish to user's recipes
@@ -96,16 +497,57 @@ def save_dish_to_user_recipes(user_id):
         recipe_id = db.save_dish_to_user_recipes(user_id, dish_id, custom_name)
         
         if recipe_id:
-            logger.info(f"Saved dish {dish_id} as recipe {recipe_id} for user {user_id}")
+            logger.info("Saved dish %s as recipe %s for user %s", dish_id, recipe_id, user_id)
             return jsonify({
                 "message": "Recipe saved successfully",
                 "recipeId": recipe_id
             }), 201
         else:
-            return jsonify({"error": "Recipe already exists or dish not found"}), 409
+            return jsonify({"error": "Dish not found"}), 404
             
+    except DuplicateKeyError:
+        return jsonify({"error": "Recipe already exists"}), 409
     except Exception as e:
-        logger.error(f"Error saving dish for {user_id}: {str(e)}")
+        logger.error("Error saving dish for %s: %s", user_id, e)
+        return jsonify({"error": str(e)}), 500
+
+# Bulk save/delete of user's recipes
+MAX_BULK_ITEMS = 1000
+
+@app.route('/user/<user_id>/recipes/bulk', methods=['POST'])
+def bulk_user_recipes(user_id):
+    """Save and delete many recipes in one request.
+
+    Body: {"save": ["<dishid>" or {"dishid": ..., "customname": ...}], "delete": ["<recipeid>"]}
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "JSON body with save and/or delete lists is required"}), 400
+
+        save_items = data.get('save', [])
+        delete_ids = data.get('delete', [])
+        if not isinstance(save_items, list) or not isinstance(delete_ids, list):
+            return jsonify({"error": "save and delete must be lists"}), 400
+        if len(save_items) + len(delete_ids) > MAX_BULK_ITEMS:
+            return jsonify({"error": f"At most {MAX_BULK_ITEMS} items per request"}), 400
+
+        save = []
+        for item in save_items:
+            if isinstance(item, str):
+                save.append((item, None))
+            elif isinstance(item, dict) and isinstance(item.get('dishid'), str):
+                save.append((item['dishid'], item.get('customname')))
+            else:
+                return jsonify({"error": "Each save item needs a dishid"}), 400
+        if not all(isinstance(recipe_id, str) for recipe_id in delete_ids):
+            return jsonify({"error": "delete must be a list of recipe IDs"}), 400
+
+        results = db.bulk_update_user_recipes(user_id, save=save, delete=delete_ids)
+        logger.info("Bulk update for user %s: %s saves, %s deletes", user_id, len(save), len(delete_ids))
+        return jsonify(results), 200
+    except Exception as e:
+        logger.error("Error in bulk recipe update for %s: %s", user_id, e)
         return jsonify({"error": str(e)}), 500
 
 # Delete user's recipe
@@ -116,13 +558,13 @@ def delete_user_recipe_route(user_id, recipe_id):
         deleted = db.delete_user_recipe(user_id, recipe_id)
         
         if deleted:
-            logger.info(f"Deleted recipe {recipe_id} for user {user_id}")
+            logger.info("Deleted recipe %s for user %s", recipe_id, user_id)
             return jsonify({"message": "Recipe deleted successfully"}), 200
         else:
             return jsonify({"error": "Recipe not found"}), 404
             
     except Exception as e:
-        logger.error(f"Error deleting recipe {recipe_id} for {user_id}: {str(e)}")
+        logger.error("Error deleting recipe %s for %s: %s", recipe_id, user_id, e)
         return jsonify({"error": str(e)}), 500
 
 # Update user recipe
@@ -137,7 +579,7 @@ def update_user_recipe(userid, recipeid):
         else:
             return jsonify({"error": "Recipe not found"}), 404
     except Exception as e:
-        logger.error(f"Error updating recipe {recipeid} for {userid}: {str(e)}")
+        logger.error("Error updating recipe %s for %s: %s", recipeid, userid, e)
         return jsonify({"error": str(e)}), 500
 
 # Seed routes
@@ -148,27 +590,36 @@ def seed_database():
         result = seed_manager.seed_database(force=False)
         return jsonify({"message": result}), 200
     except Exception as e:
-        logger.error(f"Error seeding database: {str(e)}")
+        logger.error("Error seeding database: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/force-seed', methods=['POST'])
 def force_seed_database():
-    """Force seed database (clears existing data)"""
+    """Force seed database (rewrites every seed dish, keeps user recipes)"""
     try:
         result = seed_manager.seed_database(force=True)
         return jsonify({"message": result}), 200
     except Exception as e:
-        logger.error(f"Error force seeding database: {str(e)}")
+        logger.error("Error force seeding database: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/seed-info', methods=['GET'])
 def get_seed_info():
     """Get information about seed data"""
     try:
+        # Live counts only if the background snapshot is already available
+        database_stats = statistics.snapshot(wait=False)
+        # Weak: age_seconds may differ, the content is the same until the next refresh
+        etag = make_etag("seed-info", database_stats and database_stats["refreshed_at"])
+        cached = not_modified(etag, CATALOG_CACHE_CONTROL, weak=True)
+        if cached:
+            return cached
         stats = seed_manager.get_seed_statistics()
-        return jsonify(stats), 200
+        if database_stats is not None:
+            stats["database"] = database_stats
+        return with_cache_headers(jsonify(stats), etag, CATALOG_CACHE_CONTROL, weak=True), 200
     except Exception as e:
-        logger.error(f"Error getting seed info: {str(e)}")
+        logger.error("Error getting seed info: %s", e)
         return jsonify({"error": str(e)}), 500
 
 # Health check
@@ -177,21 +628,207 @@ def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "GeoDish API is running"}), 200
 
+# Batched requests: one round trip for several API calls
+MAX_BATCH_OPERATIONS = 20
+BATCH_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+# Only these request headers are passed on to an operation
+BATCH_FORWARDED_HEADERS = {'if-none-match', 'accept'}
+batch_pool = ThreadPoolExecutor(max_workers=Config.BATCH_MAX_WORKERS, thread_name_prefix='geodish-batch')
+
+def run_batch_operation(operation, base_url):
+    """Run one operation through its route's view function; returns its result document"""
+    result = {"status": 500, "body": None}
+    if 'id' in operation:
+        result["id"] = operation['id']
+    try:
+        headers = {name: value for name, value in (operation.get('headers') or {}).items()
+                   if name.lower() in BATCH_FORWARDED_HEADERS}
+        # A fresh app context gives the operation its own g, so its teardown cannot
+        # end the profile of the /batch request it runs inside
+        with app.app_context(), app.test_request_context(operation['path'], base_url=base_url,
+                                                         method=operation['method'],
+                                                         json=operation.get('body'), headers=headers):
+            if request.routing_exception is not None:
+                error = request.routing_exception
+                result["status"] = getattr(error, 'code', None) or 404
+                result["body"] = {"error": getattr(error, 'name', 'Not Found')}
+                return result
+            # Checked on the matched route, so encoded or aliased paths cannot nest a batch either
+            if request.url_rule.endpoint == 'batch_requests':
+                result["status"] = 400
+                result["body"] = {"error": "Batches cannot be nested"}
+                return result
+            response = app.make_response(app.view_functions[request.url_rule.endpoint](**request.view_args))
+            result["status"] = response.status_code
+            if response.headers.get('ETag'):
+                result["etag"] = response.headers['ETag']
+            body = response.get_data(as_text=True)
+            if body:
+                # Route bodies are already JSON (or pre-encoded dish payloads), so splice them in
+                result["body"] = RawJSON(body) if response.is_json else body
+    except Exception as e:
+        logger.error("Error in batch operation %s %s: %s", operation['method'], operation['path'], e)
+        result["status"] = 500
+        result["body"] = {"error": str(e)}
+    return result
+
+@app.route('/batch', methods=['POST'])
+def batch_requests():
+    """Run several API calls in one request; results come back in operation order.
+
+    Body: {"operations": [{"id": "c", "method": "GET", "path": "/countries"},
+                          {"method": "POST", "path": "/user/u1/save-dish", "body": {...}}]}
+    Consecutive GETs run concurrently; any other method waits for the reads
+    before it and runs before the operations after it.
+    """
+    try:
+        data = request.get_json(silent=True)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "operations list is required"}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+        for operation in operations:
+            if not isinstance(operation, dict) or not isinstance(operation.get('path'), str) \
+                    or not operation['path'].startswith('/'):
+                return jsonify({"error": "Each operation needs a path starting with /"}), 400
+            operation['method'] = str(operation.get('method', 'GET')).upper()
+            if operation['method'] not in BATCH_METHODS:
+                return jsonify({"error": f"method must be one of {', '.join(sorted(BATCH_METHODS))}"}), 400
+            if not isinstance(operation.get('headers', {}), dict):
+                return jsonify({"error": "headers must be an object"}), 400
+
+        base_url = request.host_url
+        results = [None] * len(operations)
+        reads = []
+        for index, operation in enumerate(operations):
+            if operation['method'] == 'GET':
+                reads.append((index, batch_pool.submit(run_batch_operation, operation, base_url)))
+                continue
+            for read_index, future in reads:
+                results[read_index] = future.result()
+            reads = []
+            results[index] = run_batch_operation(operation, base_url)
+        for read_index, future in reads:
+            results[read_index] = future.result()
+
+        body = '{"results":[' + ','.join(encode_document(result) for result in results) + ']}'
+        return Response(body, mimetype='application/json'), 200
+    except Exception as e:
+        logger.error("Error running batch: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+# Request profile captures
+def has_profile_access():
+    return verify_profile_token(profiler.secret, request.headers.get(PROFILE_HEADER))
+
+@app.route('/debug/profiles', methods=['GET'])
+def list_profiles():
+    """List stored request captures, newest first (needs a signed X-GeoDish-Profile header)"""
+    try:
+        if not has_profile_access():
+            return jsonify({"error": f"A valid signed {PROFILE_HEADER} header is required"}), 403
+        return jsonify({"captures": profiler.store.list(), "slow_request_ms": profiler.slow_ms}), 200
+    except Exception as e:
+        logger.error("Error listing profiles: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/debug/profiles/<capture_id>', methods=['GET'])
+def download_profile(capture_id):
+    """Download one capture as JSON, or its stacks for flamegraph tools with ?format=collapsed"""
+    try:
+        if not has_profile_access():
+            return jsonify({"error": f"A valid signed {PROFILE_HEADER} header is required"}), 403
+        path = profiler.store.path(capture_id)
+        if path is None:
+            return jsonify({"error": "Profile not found"}), 404
+        if request.args.get('format') == 'collapsed':
+            with open(path, encoding='utf-8') as f:
+                stacks = json.load(f)["stacks"]
+            body = ''.join(f"{stack} {count}\n" for stack, count in stacks.items())
+            return Response(body, mimetype='text/plain'), 200
+        return send_file(path, mimetype='application/json', as_attachment=True,
+                         download_name=f"{capture_id}.json")
+    except Exception as e:
+        logger.error("Error downloading profile %s: %s", capture_id, e)
+        return jsonify({"error": str(e)}), 500
+
 # Metrics for monitoring
+def wants_prometheus_format():
+    """Prometheus asks for text/plain or OpenMetrics; ?format=prometheus forces it"""
+    if request.args.get('format') == 'prometheus':
+        return True
+    # Highest-quality concrete media type; wildcards and browsers fall back to JSON
+    preferred = max(
+        ((quality, value.split(';')[0].strip()) for value, quality in request.accept_mimetypes
+         if '*' not in value),
+        default=(0, None)
+    )[1]
+    return preferred in ('text/plain', 'application/openmetrics-text')
+
 @app.route('/metrics', methods=['GET'])
 def get_metrics():
-    """Get application metrics"""
+    """Get application metrics (Prometheus text for scrapers, JSON otherwise)"""
+    if wants_prometheus_format():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
     try:
-        total_dishes = db.get_total_dish_count()
-        countries = db.get_countries()
+        stats = statistics.snapshot()
         return jsonify({
-            "total_dishes": total_dishes,
-            "total_countries": len(countries),
+            "total_dishes": stats["total_dishes"],
+            "total_countries": stats["total_countries"],
+            "dishes_per_country": stats["dishes_per_country"],
+            "total_users": stats["total_users"],
+            "saved_recipes": stats["saved_recipes"],
+            "stats_age_seconds": stats["age_seconds"],
+            "catalog_version": db.catalog_version,
+            "recipe_cache": db.recipe_cache.stats(),
+            "single_flight": db.flights.stats(),
             "status": "healthy"
         }), 200
+    except SingleFlightTimeout as e:
+        logger.warning("Overloaded: %s", e)
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error getting metrics: {str(e)}")
+        logger.error("Error getting metrics: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# CLI commands
+@app.cli.command('seed-dishes')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Dishes upserted per bulk write')
+@click.option('--force', is_flag=True, help='Rewrite dishes even if their content is unchanged')
+def seed_dishes_command(path, batch_size, force):
+    """Incrementally seed dishes from a JSONL file"""
+    stats = seed_manager.seed_dishes_from_jsonl(path, batch_size=batch_size, force=force)
+    click.echo(f"Seeded {stats['processed']} dishes in {stats['seconds']}s "
+               f"({stats['dishes_per_second']} dishes/s): {stats['inserted']} new, "
+               f"{stats['updated']} updated, {stats['unchanged']} unchanged")
+
+@app.cli.command('migrate-recipe-storage')
+@click.option('--batch-size', default=500, show_default=True, help='Recipes converted per bulk write')
+def migrate_recipe_storage(batch_size):
+    """Convert embedded saved recipes to reference storage (run with RECIPE_STORAGE=reference)"""
+    scanned = converted = 0
+    for scanned, converted in db.migrate_recipes_to_references(batch_size=batch_size):
+        click.echo(f"Scanned {scanned} recipes, converted {converted}")
+    click.echo(f"Migration complete: {converted} of {scanned} embedded recipes converted")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify and content-hash static assets into static/dist with .gz/.br siblings"""
+    manifest = build_assets(static_folder)
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f"{name} -> {hashed}")
+    click.echo(f"Wrote static/dist/index.html referencing {len(manifest)} fingerprinted assets")
+
+@app.cli.command('profile-token')
+@click.option('--ttl', default=3600, show_default=True, help='Seconds until the token expires')
+def profile_token_command(ttl):
+    """Print an X-GeoDish-Profile header value signed with PROFILE_SECRET"""
+    if not Config.PROFILE_SECRET:
+        raise click.ClickException("PROFILE_SECRET is not set")
+    click.echo(sign_profile_token(Config.PROFILE_SECRET, time.time() + ttl))
+
 if __name__ == '__main__':
+    warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+GeoDish Static Assets
+Build step that minifies and fingerprints static/ assets, and the in-memory index page
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # optional: .br files are only written when it is installed
+    brotli = None
+
+# Built files go to static/<BUILD_DIR>; only these get content-hashed names
+BUILD_DIR = 'dist'
+FINGERPRINTED = ('script.js', 'style.css')
+# Files smaller than this are not worth a compressed sibling
+MIN_COMPRESS_SIZE = 1024
+# Content-Encoding and file suffix of the siblings compress() writes, most preferred first
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+_FINGERPRINTED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+    """Drop comments and the whitespace around braces, semicolons and commas"""
+    text = _CSS_COMMENT.sub('', text)
+    text = _CSS_PUNCTUATION.sub(r'\1', ' '.join(text.split()))
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def minify_js(text):
+    """Drop indentation, blank lines and whole-line // comments.
+
+    Line breaks are kept, so automatic semicolon insertion is unaffected.
+    Literals are not parsed: lines inside a multi-line template literal also
+    lose their indentation, and are dropped if they start with //. That only
+    changes whitespace in the HTML templates of static/script.js, so keep
+    '//' lines out of template literals.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def fingerprint(name, content):
+    """'script.js' -> 'script.<first 12 hex of sha256>.js'"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def is_fingerprinted(name):
+    """True for names fingerprint() produced, whose content never changes"""
+    return bool(_FINGERPRINTED_NAME.search(name))
+
+
+def compress(path, content):
+    """Write path.gz (and path.br with brotli) next to path; returns the suffixes written"""
+    if len(content) < MIN_COMPRESS_SIZE:
+        return []
+    # mtime=0 keeps the .gz byte-identical between builds of the same content
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    written = ['.gz']
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(content))
+        written.append('.br')
+    return written
+
+
+def precompressed_variant(path, accept_encodings):
+    """(path, Content-Encoding) of the best compressed sibling the client accepts, else (path, None)"""
+    for encoding, suffix in PRECOMPRESSED:
+        if accept_encodings[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def build_assets(static_folder):
+    """Minify and fingerprint FINGERPRINTED into static/dist and rewrite index.html to use them.
+
+    Earlier builds are removed first. Returns the manifest
+    {original name: hashed name}, which is also written as manifest.json.
+    """
+    out_dir = os.path.join(static_folder, BUILD_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        os.remove(os.path.join(out_dir, name))
+
+    manifest = {}
+    for name in FINGERPRINTED:
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            text = f.read()
+        minify = MINIFIERS.get(os.path.splitext(name)[1])
+        content = (minify(text) if minify else text).encode('utf-8')
+        hashed = fingerprint(name, content)
+        with open(os.path.join(out_dir, hashed), 'wb') as f:
+            f.write(content)
+        compress(os.path.join(out_dir, hashed), content)
+        manifest[name] = hashed
+
+    with open(os.path.join(static_folder, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    for name, hashed in manifest.items():
+        html = html.replace(f'"/static/{name}"', f'"/static/{BUILD_DIR}/{hashed}"')
+    content = html.encode('utf-8')
+    with open(os.path.join(out_dir, 'index.html'), 'wb') as f:
+        f.write(content)
+    compress(os.path.join(out_dir, 'index.html'), content)
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class IndexPage:
+    """index.html held in memory with its ETag and a gzipped copy.
+
+    Prefers the built static/dist/index.html (hashed asset names) and falls
+    back to static/index.html when no build has run. Loaded once per process,
+    so a new build takes effect on restart.
+    """
+
+    def __init__(self, static_folder):
+        self.path = None
+        self.body = None
+        self.gzipped = None
+        self.etag = None
+        for path in (os.path.join(static_folder, BUILD_DIR, 'index.html'),
+                     os.path.join(static_folder, 'index.html')):
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self.body = f.read()
+                self.path = path
+                self.etag = hashlib.sha256(self.body).hexdigest()[:20]
+                self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+                break
+
@@ -1,5 +1,87 @@
 import os
 
+
+def default_web_workers(limit=4):
+    """CPUs this process may run on (not the host's count), capped at limit.
+
+    Every worker holds its own copy of the catalog caches, so more workers
+    than this should be an explicit WEB_WORKERS choice.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    return max(1, min(cpus or 1, limit))
+
 class Config:
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/geodish')
     SECRET_KEY = os.getenv('SECRET_KEY', 'geodish-secret-key-2024')
+    MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'geodish')
+    # MongoClient settings, per process (timeouts in milliseconds). Compressors
+    # is a comma-separated list such as 'zstd,zlib'; empty disables compression
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+    MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zlib')
+    # 'mongo' reads the dish catalog from MongoDB; 'embedded' serves the seed
+    # catalog from memory and only uses MongoDB for user recipes
+    CATALOG_MODE = os.getenv('CATALOG_MODE', 'mongo')
+    # The random-dish sampler keeps whole dish documents in memory; 'false'
+    # keeps only IDs per country and fetches the picked dishes from MongoDB
+    DISH_SAMPLER_STORE_DOCUMENTS = os.getenv('DISH_SAMPLER_STORE_DOCUMENTS', 'true').lower() == 'true'
+    # How often (seconds) each process rechecks the shared catalog version in
+    # MongoDB, i.e. how long another worker's dish write may take to show up
+    CATALOG_VERSION_CHECK_SECONDS = float(os.getenv('CATALOG_VERSION_CHECK_SECONDS', '2'))
+    # How often the background statistics snapshot behind /metrics is refreshed
+    STATS_REFRESH_SECONDS = int(os.getenv('STATS_REFRESH_SECONDS', '30'))
+    # How saved recipes hold their dish: 'embedded' copies the whole dish into
+    # each recipe, 'reference' stores only dish_id and fills it in from the catalog
+    RECIPE_STORAGE = os.getenv('RECIPE_STORAGE', 'embedded')
+    # Per-process cache of users' saved recipes: at most RECIPE_CACHE_MAX_RECIPES
+    # documents across all users (0 disables it), evicted by policy 'lru' or 'fifo'
+    RECIPE_CACHE_MAX_RECIPES = int(os.getenv('RECIPE_CACHE_MAX_RECIPES', '50000'))
+    RECIPE_CACHE_TTL_SECONDS = int(os.getenv('RECIPE_CACHE_TTL_SECONDS', '300'))
+    RECIPE_CACHE_POLICY = os.getenv('RECIPE_CACHE_POLICY', 'lru')
+    # Warm-up preloads the sampler, search index and pantry matcher only for
+    # catalogs up to this many dishes; larger ones load on first use
+    WARM_UP_MAX_DISHES = int(os.getenv('WARM_UP_MAX_DISHES', '20000'))
+    # Similar dishes kept per dish, and the catalog size up to which warm-up
+    # computes every list (larger catalogs compute lists on first request)
+    SIMILAR_DISHES_K = int(os.getenv('SIMILAR_DISHES_K', '10'))
+    SIMILAR_PRECOMPUTE_MAX_DISHES = int(os.getenv('SIMILAR_PRECOMPUTE_MAX_DISHES', '20000'))
+    # Longest a request waits on an identical in-flight MongoDB read before failing
+    SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv('SINGLE_FLIGHT_TIMEOUT_SECONDS', '5'))
+    # Cache-Control max-age (seconds) for catalog responses such as /countries
+    CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', '60'))
+    # Logging: LOG_FORMAT 'json' or 'text'. Success logs (below WARNING) are kept
+    # with LOG_SAMPLE_RATE, overridden per route by LOG_ROUTE_SAMPLE_RATES such as
+    # 'GET /countries=0.01,/health=0'; each route emits at most
+    # LOG_ERROR_RATE_PER_SECOND warnings/errors (0 disables the limit).
+    # Records beyond LOG_QUEUE_SIZE waiting for the writer thread are dropped
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+    LOG_ROUTE_SAMPLE_RATES = os.getenv('LOG_ROUTE_SAMPLE_RATES', '')
+    LOG_ERROR_RATE_PER_SECOND = float(os.getenv('LOG_ERROR_RATE_PER_SECOND', '10'))
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    # Request profiling: requests slower than PROFILE_SLOW_REQUEST_MS (0 disables)
+    # store their MongoDB timeline in PROFILE_DIR, keeping the newest
+    # PROFILE_MAX_CAPTURES. Stack sampling every PROFILE_SAMPLE_INTERVAL_MS runs for
+    # every request with PROFILE_ALL_REQUESTS, or for requests signed with
+    # PROFILE_SECRET (see `flask profile-token`), which also guards /debug/profiles
+    PROFILE_SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUEST_MS', '1000'))
+    PROFILE_ALL_REQUESTS = os.getenv('PROFILE_ALL_REQUESTS', 'false').lower() == 'true'
+    PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/geodish-profiles')
+    PROFILE_MAX_CAPTURES = int(os.getenv('PROFILE_MAX_CAPTURES', '50'))
+    # Threads per process running the read operations of POST /batch concurrently
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+    # Production server (gunicorn.conf.py): worker processes, threads per
+    # worker and timeouts in seconds
+    WEB_PORT = int(os.getenv('WEB_PORT', '5000'))
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', str(default_web_workers())))
+    WEB_THREADS = int(os.getenv('WEB_THREADS', '8'))
+    WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', '30'))
+    WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '20'))
+    WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', '5'))
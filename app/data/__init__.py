@@ -1,12 +1,14 @@
 """
 GeoDish Data Package
 """
-from .seed_data import GEODISH_SEED_DATA, get_countries, get_dishes_by_country, get_dish_count, get_country_count
+from .seed_data import GEODISH_SEED_DATA, get_countries, get_dishes_by_country, get_dish_count, get_country_count, get_dish_id, get_catalog_documents
 
 __all__ = [
     'GEODISH_SEED_DATA',
     'get_countries', 
     'get_dishes_by_country',
     'get_dish_count',
-    'get_country_count'
+    'get_country_count',
+    'get_dish_id',
+    'get_catalog_documents'
 ]
@@ -2,6 +2,7 @@
 GeoDish Seed Data - Single Source of Truth
 All countries and dishes defined here
 """
+import hashlib
 
 # Complete seed data for all 25 countries
 GEODISH_SEED_DATA = [
@@ -190,3 +191,17 @@ def get_dish_count():
 def get_country_count():
     """Get total number of countries"""
     return len(get_countries())
+
+def get_dish_id(dish):
+    """Get a stable ObjectId-compatible ID derived from a dish's country and name"""
+    key = f"{dish['country']}:{dish['name']}".encode('utf-8')
+    return hashlib.sha1(key).hexdigest()[:24]
+
+def get_catalog_documents():
+    """Get copies of all seed dishes with stable string IDs"""
+    documents = []
+    for dish in GEODISH_SEED_DATA:
+        document = {key: value for key, value in dish.items() if key != '_id'}
+        document['_id'] = get_dish_id(dish)
+        documents.append(document)
+    return documents
@@ -0,0 +1,175 @@
+"""
+GeoDish Synthetic Data - deterministic large-scale datasets for scale testing
+
+Every record is derived from (seed, index), so any dish can be regenerated on
+its own and datasets are identical across runs and machines. Records are
+streamed from generators and never materialized as a whole.
+
+    python -m app.data.synthetic --dishes 1000000 --users 200000 --out-dir /tmp/geodish
+    python -m app.data.synthetic --dishes 100000 --users 20000 --load
+"""
+import argparse
+import json
+import os
+import random
+
+from .seed_data import GEODISH_SEED_DATA, get_countries
+
+# Seed vocabulary, extended with synthetic entries to reach realistic sizes
+SEED_INGREDIENTS = sorted({ingredient for dish in GEODISH_SEED_DATA for ingredient in dish['ingredients']})
+SEED_COUNTRIES = get_countries()
+
+DISH_STYLES = ["Classic", "Spicy", "Smoked", "Grilled", "Braised", "Crispy", "Slow-Cooked",
+               "Roasted", "Street-Style", "Festive", "Rustic", "Home-Style"]
+DISH_BASES = ["Stew", "Curry", "Salad", "Soup", "Flatbread", "Dumplings", "Noodles",
+              "Skewers", "Pie", "Rice", "Tart", "Casserole", "Wrap", "Porridge"]
+COOKING_STEPS = ["Chop", "Marinate", "Simmer", "Sear", "Bake", "Steam", "Fry", "Whisk",
+                 "Fold in", "Season", "Toast", "Reduce"]
+
+
+def zipf_index(rng, n):
+    """Pick an index in [0, n) with probability roughly proportional to 1 / (index + 1)"""
+    # (n + 1) ** u - 1 spans [0, n); the clamp only guards float rounding at the top
+    return min(n - 1, int((n + 1) ** rng.random()) - 1)
+
+
+def synthetic_dish_id(seed, index):
+    """ObjectId-compatible hex ID for dish number index"""
+    return f"{seed & 0xffffffff:08x}{index:016x}"
+
+
+def ingredient_vocabulary(size):
+    """Seed ingredients followed by numbered synthetic ones, size entries in total"""
+    vocabulary = list(SEED_INGREDIENTS[:size])
+    vocabulary.extend(f"ingredient-{i:05d}" for i in range(size - len(vocabulary)))
+    return vocabulary
+
+
+def country_list(count):
+    """Seed countries followed by numbered synthetic regions, count entries in total"""
+    countries = list(SEED_COUNTRIES[:count])
+    countries.extend(f"Region {i:03d}" for i in range(count - len(countries)))
+    return countries
+
+
+class SyntheticCatalog:
+    """Deterministic dish catalog of a given size"""
+
+    def __init__(self, num_dishes, seed=0, num_countries=100, vocabulary_size=5000):
+        self.num_dishes = num_dishes
+        self.seed = seed
+        self.countries = country_list(num_countries)
+        self.vocabulary = ingredient_vocabulary(vocabulary_size)
+
+    def dish(self, index):
+        """Generate dish number index; the same (seed, index) always yields the same dish"""
+        rng = random.Random(f"{self.seed}:dish:{index}")
+        # Country sizes and ingredient popularity are both Zipf-skewed
+        country = self.countries[zipf_index(rng, len(self.countries))]
+        ingredients = []
+        for _ in range(rng.randint(3, 10)):
+            ingredient = self.vocabulary[zipf_index(rng, len(self.vocabulary))]
+            if ingredient not in ingredients:
+                ingredients.append(ingredient)
+        steps = rng.sample(COOKING_STEPS, 3)
+        return {
+            "_id": synthetic_dish_id(self.seed, index),
+            "name": f"{rng.choice(DISH_STYLES)} {rng.choice(DISH_BASES)} {index}",
+            "country": country,
+            "ingredients": ingredients,
+            "instructions": f"{steps[0]} the {ingredients[0]}, {steps[1].lower()}, then {steps[2].lower()}"
+        }
+
+    def dishes(self):
+        """Yield every dish in index order"""
+        for index in range(self.num_dishes):
+            yield self.dish(index)
+
+
+def generate_user_recipes(catalog, num_users, seed=0, mean_recipes=8.0, max_recipes=5000):
+    """Yield saved recipes for num_users users.
+
+    Recipes per user follow a heavy-tailed (Pareto) distribution, so most users
+    have a handful and a few power users have thousands; dish choice is
+    Zipf-skewed towards popular dishes. Documents use reference storage.
+    """
+    max_recipes = min(max_recipes, catalog.num_dishes // 2)
+    # (Pareto(1.5) - 1) has mean 2, and is zero or near zero for most users
+    scale = mean_recipes / 2.0
+    for user_index in range(num_users):
+        rng = random.Random(f"{seed}:user:{user_index}")
+        user_id = f"user-{user_index:07d}"
+        count = min(max_recipes, int((rng.paretovariate(1.5) - 1) * scale))
+        chosen = set()
+        attempts = 0
+        while len(chosen) < count:
+            # Fall back to uniform picks once the popular head is exhausted
+            if attempts < 10 * count:
+                chosen.add(zipf_index(rng, catalog.num_dishes))
+            else:
+                chosen.add(rng.randrange(catalog.num_dishes))
+            attempts += 1
+        for dish_index in sorted(chosen):
+            dish = catalog.dish(dish_index)
+            yield {
+                "user_id": user_id,
+                "dish_id": dish['_id'],
+                "custom_name": dish['name'],
+                "saved_at": None
+            }
+
+
+def write_jsonl(records, path):
+    """Stream records to a JSONL file, returning the number written"""
+    written = 0
+    with open(path, 'w') as output:
+        for record in records:
+            output.write(json.dumps(record))
+            output.write('\n')
+            written += 1
+    return written
+
+
+def read_jsonl(path):
+    """Stream records back from a JSONL file"""
+    with open(path) as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic GeoDish datasets")
+    parser.add_argument('--dishes', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--countries', type=int, default=100)
+    parser.add_argument('--vocabulary', type=int, default=5000, help='Number of distinct ingredients')
+    parser.add_argument('--mean-recipes', type=float, default=8.0, help='Mean saved recipes per user')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--out-dir', help='Write dishes.jsonl and user_recipes.jsonl here')
+    parser.add_argument('--load', action='store_true', help='Load into MONGODB_URI through SeedManager')
+    args = parser.parse_args(argv)
+
+    catalog = SyntheticCatalog(args.dishes, seed=args.seed,
+                               num_countries=args.countries, vocabulary_size=args.vocabulary)
+    recipes = generate_user_recipes(catalog, args.users, seed=args.seed, mean_recipes=args.mean_recipes)
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+        dishes_written = write_jsonl(catalog.dishes(), os.path.join(args.out_dir, 'dishes.jsonl'))
+        recipes_written = write_jsonl(recipes, os.path.join(args.out_dir, 'user_recipes.jsonl'))
+        print(f"Wrote {dishes_written} dishes and {recipes_written} saved recipes to {args.out_dir}")
+    elif args.load:
+        from ..models import Database
+        from ..seed_manager import SeedManager
+        seed_manager = SeedManager(Database())
+        dish_stats = seed_manager.seed_dishes(catalog.dishes(), batch_size=args.batch_size)
+        recipes_loaded = seed_manager.load_user_recipes(recipes, batch_size=args.batch_size)
+        print(f"Seeded dishes: {dish_stats}; loaded {recipes_loaded} saved recipes")
+    else:
+        parser.error("one of --out-dir or --load is required")
+
+
+if __name__ == '__main__':
+    main()
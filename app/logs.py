@@ -0,0 +1,168 @@
+"""
+GeoDish Logging
+Structured JSON records handed to a background writer thread, with per-route
+sampling of success logs and rate-limited errors
+"""
+from logging.handlers import QueueHandler, QueueListener
+import json
+import logging
+import queue
+import random
+import threading
+import time
+
+from flask import has_request_context, request
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def parse_sample_rates(spec):
+    """'GET /countries=0.01,/health=0' -> {'GET /countries': 0.01, '/health': 0.0}"""
+    rates = {}
+    for item in spec.split(','):
+        route, _, rate = item.strip().rpartition('=')
+        if route:
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class RequestSampler(logging.Filter):
+    """Tags records with the request's route and drops most of the noise.
+
+    Records below WARNING are kept with the route's sample rate (a route is
+    'METHOD /rule' or just '/rule'). WARNING and above are never sampled but
+    each route may emit at most error_rate of them per second; the number
+    suppressed is reported on the next one that gets through.
+    """
+
+    def __init__(self, sample_rate=1.0, route_rates=None, error_rate=10.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.route_rates = route_rates or {}
+        self.error_rate = error_rate
+        self.sampled_out = 0
+        self.suppressed = 0
+        self._buckets = {}  # route -> [tokens, last refill, suppressed since last emit]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        route = method = None
+        if has_request_context():
+            method = request.method
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'
+            record.route = route
+            record.method = method
+
+        if record.levelno < logging.WARNING:
+            rate = self.route_rates.get(f"{method} {route}", self.route_rates.get(route, self.sample_rate))
+            if rate >= 1.0 or random.random() < rate:
+                return True
+            self.sampled_out += 1
+            return False
+        return self._allow_error(record, route)
+
+    def _allow_error(self, record, route):
+        if self.error_rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(route)
+            if bucket is None:
+                bucket = self._buckets[route] = [self.error_rate, now, 0]
+            bucket[0] = min(self.error_rate, bucket[0] + (now - bucket[1]) * self.error_rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+    def stats(self):
+        return {"sampled_out": self.sampled_out, "suppressed": self.suppressed}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the writer thread.
+
+    The stock handler renders the message in the calling thread; here the
+    record goes on the queue as-is and a full queue drops it instead of
+    blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Root logging setup: filter and enqueue in the caller, format and write in a thread"""
+
+    def __init__(self, level='INFO', json_format=True, sample_rate=1.0, route_rates=None,
+                 error_rate=10.0, queue_size=10000, stream=None):
+        self.sampler = RequestSampler(sample_rate, route_rates, error_rate)
+        self.handler = DeferredQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(self.sampler)
+        writer = logging.StreamHandler(stream)
+        writer.setFormatter(JSONFormatter() if json_format else
+                            logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+        self.listener = QueueListener(self.handler.queue, writer, respect_handler_level=True)
+        self.level = level
+        self._started = False
+
+    def install(self):
+        """Route the root logger through the queue and start the writer thread"""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, DeferredQueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.start()
+        return self
+
+    def start(self):
+        if not self._started:
+            self.listener.start()
+            self._started = True
+
+    def stop(self):
+        """Flush queued records and stop the writer thread"""
+        if self._started:
+            self.listener.stop()
+            self._started = False
+
+    def stats(self):
+        return {**self.sampler.stats(), "dropped": self.handler.dropped,
+                "queued": self.handler.queue.qsize()}
@@ -0,0 +1,173 @@
+"""
+GeoDish Metrics
+In-process latency histograms exposed in Prometheus text format
+"""
+from pymongo import monitoring
+import bisect
+import threading
+
+# Upper bounds in seconds, from sub-millisecond cache hits to slow queries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Connection management commands that would only add noise to the histograms
+IGNORED_COMMANDS = {'hello', 'ismaster', 'isMaster', 'ping', 'buildinfo', 'buildInfo',
+                    'saslStart', 'saslContinue', 'endSessions', 'killCursors'}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values.
+
+    Each label combination owns a flat list of bucket counts plus sum and
+    count; observe() does one bisect and holds the lock only for the updates.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Buckets, then +Inf, then sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time.
+
+    Without label names the callback returns a number; with label names it
+    returns (label_values, value) pairs.
+    """
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, help_text, callback, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.label_names = tuple(label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            value = self.callback()
+        except Exception:
+            # A failing source (e.g. MongoDB down) must not break the whole scrape
+            return lines
+        if not self.label_names:
+            lines.append(f"{self.name} {value}")
+            return lines
+        for label_values, series_value in sorted(value):
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {series_value}")
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """Monotonic counter kept elsewhere (e.g. cache hit counts), read at scrape time"""
+
+    metric_type = 'counter'
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name, help_text, callback, label_names=()):
+        """Register (or replace) a callback gauge"""
+        self._metrics[name] = Gauge(name, help_text, callback, label_names)
+        return self._metrics[name]
+
+    def counter(self, name, help_text, callback, label_names=()):
+        """Register (or replace) a callback counter"""
+        self._metrics[name] = CallbackCounter(name, help_text, callback, label_names)
+        return self._metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+mongo_command_seconds = registry.histogram(
+    'geodish_mongo_command_duration_seconds',
+    'MongoDB command latency by collection, command and outcome',
+    ('collection', 'command', 'outcome')
+)
+
+http_request_seconds = registry.histogram(
+    'geodish_http_request_duration_seconds',
+    'HTTP request latency by method, route and status code',
+    ('method', 'route', 'status')
+)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """pymongo command listener feeding mongo_command_seconds"""
+
+    def __init__(self, histogram=mongo_command_seconds):
+        self.histogram = histogram
+        # (connection, request_id) -> collection name, filled in by started()
+        self._collections = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        # getMore names the collection separately from its cursor id
+        collection = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        self._record(event, 'success')
+
+    def failed(self, event):
+        self._record(event, 'failure')
+
+    def _record(self, event, outcome):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        self.histogram.observe(event.duration_micros / 1e6, collection, event.command_name, outcome)
@@ -1,117 +1,1067 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, IndexModel, InsertOne, DeleteOne, UpdateOne, ReadPreference, ReturnDocument
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 from bson import ObjectId
+from collections import Counter, OrderedDict
+import hashlib
+from urllib.parse import parse_qs, urlsplit
+from .config import Config
+from .data import get_catalog_documents
+from .metrics import MongoCommandListener
+from .pantry import PantryMatcher
+from .profiling import ProfileCommandListener
+from .search import SearchIndex
+from .serialization import DishPayloadCache
+from .similarity import SimilarityIndex
+from .singleflight import SingleFlight, acquire
+import itertools
 import os
 import random
+import threading
+import time
+
+
+class CatalogCache:
+    """In-process snapshot of catalog aggregates, keyed by a catalog version.
+
+    Holds the sorted country list, per-country dish counts and the total dish
+    count. The version is the shared catalog version kept in MongoDB (see
+    Database.catalog_version); when it moves on, the next read notices the
+    mismatch and reloads the snapshot with a single aggregation. Concurrent
+    readers of a stale snapshot wait (up to wait_timeout) for that one load.
+    """
+
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self.version = 0
+        self._version_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._snapshot = None
+
+    def advance(self, version):
+        """Move to a newer catalog version; returns the version it replaced, or None if not newer"""
+        with self._version_lock:
+            if version <= self.version:
+                return None
+            previous, self.version = self.version, version
+            return previous
+
+    def get(self, loader):
+        """Return the current snapshot, calling loader() only when stale"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot['version'] == self.version:
+            return snapshot
+
+        with acquire(self._load_lock, self.wait_timeout, "the catalog snapshot"):
+            # Another thread may have refreshed while we waited for the lock
+            version = self.version
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot['version'] == version:
+                return snapshot
+
+            counts = loader()
+            # The version is shared, so every process serves the same ETag for the same catalog
+            fingerprint = hashlib.sha1(repr(sorted(counts.items())).encode()).hexdigest()[:16]
+            snapshot = {
+                "version": version,
+                "etag": f"{fingerprint}-{version}",
+                "countries": tuple(sorted(counts)),
+                "country_counts": counts,
+                "total": sum(counts.values())
+            }
+            self._snapshot = snapshot
+            return snapshot
+
+
+class DishSampler:
+    """Uniform random dish picker backed by compact per-country arrays.
+
+    The arrays are rebuilt from one scan of the dishes collection whenever the
+    catalog version changes, so each pick is an O(1) index into a list instead
+    of a $match/$sample aggregation. With store_documents disabled only dish ids
+    are kept in memory and the picked documents are fetched by id.
+    """
+
+    def __init__(self, store_documents=True, wait_timeout=None):
+        self.store_documents = store_documents
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_country = {}
+        self._by_id = {}
+
+    def refresh(self, version, loader):
+        """Rebuild the per-country arrays from loader() if version changed"""
+        if self._version == version:
+            return
+        with acquire(self._lock, self.wait_timeout, "the dish sampler"):
+            if self._version == version:
+                return
+            by_country = {}
+            by_id = {}
+            for dish in loader():
+                dish['_id'] = str(dish['_id'])
+                entry = dish if self.store_documents else dish['_id']
+                by_country.setdefault(dish.get('country'), []).append(entry)
+                if self.store_documents:
+                    by_id[dish['_id']] = dish
+            self._by_country = by_country
+            self._by_id = by_id
+            self._version = version
+
+    def get(self, dish_id):
+        """Return the stored document for dish_id, or None if not held in memory"""
+        return self._by_id.get(dish_id)
+
+    def sample(self, country, count=1, exclude=()):
+        """Pick up to count distinct entries for country, skipping excluded ids"""
+        entries = self._by_country.get(country, [])
+        if not entries:
+            return []
+
+        if not exclude:
+            if count == 1:
+                return [entries[random.randrange(len(entries))]]
+            return random.sample(entries, min(count, len(entries)))
+
+        # Rejection sampling stays O(count) while exclusions are sparse; fall
+        # back to filtering once the misses suggest most entries are excluded.
+        picked = {}
+        attempts = 4 * count + len(exclude)
+        while len(picked) < count and attempts > 0:
+            index = random.randrange(len(entries))
+            if index not in picked and self._entry_id(entries[index]) not in exclude:
+                picked[index] = entries[index]
+            attempts -= 1
+        if len(picked) < count:
+            remaining = [
+                entry for index, entry in enumerate(entries)
+                if index not in picked and self._entry_id(entry) not in exclude
+            ]
+            picked_entries = list(picked.values())
+            picked_entries += random.sample(remaining, min(count - len(picked), len(remaining)))
+            return picked_entries
+        return list(picked.values())
+
+    def _entry_id(self, entry):
+        return entry['_id'] if self.store_documents else entry
+
+
+def insert_recipe(recipes, recipe):
+    """Add a copy of recipe to an _id-ordered recipe list.
+
+    A reload between the insert and the version bump may already hold it,
+    in which case the list is returned unchanged.
+    """
+    if any(cached['_id'] == recipe['_id'] for cached in recipes):
+        return recipes
+    recipes.append(dict(recipe))
+    if len(recipes) > 1 and recipes[-2]['_id'] > recipe['_id']:
+        recipes.sort(key=lambda cached: cached['_id'])
+    return recipes
+
+
+def apply_recipe_update(recipes, recipe_id, update_data):
+    """Apply a $set of top-level fields to the matching recipe; None if it cannot be mirrored"""
+    if any('.' in field or field.startswith('$') for field in update_data):
+        return None
+    return [
+        dict(recipe, **update_data) if str(recipe['_id']) == recipe_id else recipe
+        for recipe in recipes
+    ]
+
+
+class RecipeCache:
+    """Bounded in-process cache of each user's saved recipe documents.
+
+    Entries are tagged with the user's recipes version and only served while
+    it still matches the version in MongoDB, so writes made by other processes
+    are never hidden; the TTL just lets idle users age out. max_recipes caps
+    the documents held across all users, evicting least recently used users
+    ('lru') or the oldest entries ('fifo'). Lists are replaced, never changed
+    in place, so readers can iterate them without the lock.
+    """
+
+    POLICIES = ('lru', 'fifo')
+
+    def __init__(self, max_recipes=50000, ttl=300, policy='lru'):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown recipe cache policy: {policy}")
+        self.max_recipes = max_recipes
+        self.ttl = ttl
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # user_id -> (version, expires_at, recipes)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_recipes > 0
+
+    def get(self, user_id, version):
+        """Cached recipes for user_id at version, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and (entry[0] != version or entry[1] < time.monotonic()):
+                self._remove(user_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.policy == 'lru':
+                self._entries.move_to_end(user_id)
+            return entry[2]
+
+    def put(self, user_id, version, recipes):
+        """Cache recipes for user_id; lists larger than the whole cache are skipped"""
+        with self._lock:
+            self._remove(user_id)
+            if len(recipes) > self.max_recipes:
+                return
+            self._entries[user_id] = (version, time.monotonic() + self.ttl, recipes)
+            self._size += len(recipes)
+            while self._size > self.max_recipes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def update(self, user_id, version, change):
+        """Write-through: apply change(recipes) -> recipes for the write that produced version.
+
+        Only applies if the cached entry is exactly one version behind; any other
+        writer got in between, so the entry is dropped instead.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry[0] + 1 != version:
+                self._remove(user_id)
+                return
+        recipes = change(list(entry[2]))
+        if recipes is None:
+            self.invalidate(user_id)
+        else:
+            self.put(user_id, version, recipes)
+
+    def invalidate(self, user_id=None):
+        """Drop one user's entry, or every entry when user_id is None"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                self._size = 0
+            else:
+                self._remove(user_id)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "users": len(self._entries),
+            "recipes": self._size,
+            "max_recipes": self.max_recipes,
+            "policy": self.policy
+        }
+
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._size -= len(entry[2])
+
 
 class Database:
-    def __init__(self):
-        self.client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/'))
-        self.db = self.client.geodish
-        self.dishes = self.db.dishes
-        self.users = self.db.users
-        self.user_recipes = self.db.user_recipes
+    # Catalog modes (Config.CATALOG_MODE): mongo reads dishes from MongoDB,
+    # embedded serves the read-only seed catalog from memory
+    CATALOG_MONGO = 'mongo'
+    CATALOG_EMBEDDED = 'embedded'
+
+    # Recipe storage modes: embedded keeps a copy of the dish in every saved
+    # recipe, reference stores only dish_id plus overrides and hydrates on read
+    RECIPE_STORAGE_EMBEDDED = 'embedded'
+    RECIPE_STORAGE_REFERENCE = 'reference'
+
+    # Number of recipes hydrated per batched dish lookup
+    HYDRATE_BATCH_SIZE = 100
+
+    # Seeding bookkeeping stored on dish documents but never served
+    DISH_PROJECTION = {"content_hash": 0}
+    # Same for the dish copies embedded in saved recipes (unprojected reads)
+    RECIPE_PROJECTION = {"original_dish.content_hash": 0}
+
+    # Dish fields read to build the search index and pantry matcher
+    INDEX_PROJECTION = {"name": 1, "country": 1, "ingredients": 1, "instructions": 1}
+
+    # metadata document holding the shared catalog version
+    CATALOG_VERSION_ID = 'catalog'
+
+    # Indexes created by ensure_indexes(), per collection
+    INDEXES = {
+        "user_recipes": [
+            IndexModel([("user_id", ASCENDING), ("dish_id", ASCENDING)], name="user_dish_unique", unique=True),
+            # Also serves keyset pagination over a user's recipes by _id
+            IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_id")
+        ],
+        "dishes": [
+            # Natural key used by seeding upserts; also serves country lookups
+            IndexModel([("country", ASCENDING), ("name", ASCENDING)], name="country_name", unique=True)
+        ]
+    }
+
+    def __init__(self, uri=None, database=None, **client_options):
+        """Settings default to Config; client_options override MongoClient keyword arguments"""
+        self.uri = uri or Config.MONGODB_URI
+        self.database_name = database or Config.MONGODB_DATABASE
+        self.client_options = {
+            "maxPoolSize": Config.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": Config.MONGO_MIN_POOL_SIZE,
+            "waitQueueTimeoutMS": Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "connectTimeoutMS": Config.MONGO_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": Config.MONGO_SOCKET_TIMEOUT_MS,
+        }
+        if Config.MONGO_COMPRESSORS:
+            self.client_options["compressors"] = Config.MONGO_COMPRESSORS
+        # Options spelled out in the connection string win over Config defaults
+        uri_options = {name.lower() for name in parse_qs(urlsplit(self.uri).query)}
+        self.client_options = {
+            name: value for name, value in self.client_options.items()
+            if name.lower() not in uri_options
+        }
+        self.client_options.update(client_options)
+
+        # The MongoClient is created on first use in each process (see client)
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+        self._collections = {}
+        # Identical concurrent reads share one query; waiters give up after the timeout
+        self.flights = SingleFlight(timeout=Config.SINGLE_FLIGHT_TIMEOUT_SECONDS)
+        self.catalog_cache = CatalogCache(wait_timeout=Config.SINGLE_FLIGHT_TIMEOUT_SECONDS)
+        self.catalog_check_interval = Config.CATALOG_VERSION_CHECK_SECONDS
+        self._catalog_checked_at = float('-inf')
+        self._catalog_check_lock = threading.Lock()
+        self.dish_payloads = DishPayloadCache()
+        self.search_index = SearchIndex(wait_timeout=Config.SINGLE_FLIGHT_TIMEOUT_SECONDS)
+        self.pantry_matcher = PantryMatcher(wait_timeout=Config.SINGLE_FLIGHT_TIMEOUT_SECONDS)
+        self.similar_dishes = SimilarityIndex(self.pantry_matcher, k=Config.SIMILAR_DISHES_K)
+        self.catalog_mode = Config.CATALOG_MODE
+        self.dish_sampler = DishSampler(
+            store_documents=self.embedded_catalog or Config.DISH_SAMPLER_STORE_DOCUMENTS,
+            wait_timeout=Config.SINGLE_FLIGHT_TIMEOUT_SECONDS
+        )
+        self.recipe_storage = Config.RECIPE_STORAGE
+        self.recipe_cache = RecipeCache(
+            max_recipes=Config.RECIPE_CACHE_MAX_RECIPES,
+            ttl=Config.RECIPE_CACHE_TTL_SECONDS,
+            policy=Config.RECIPE_CACHE_POLICY
+        )
+
+        # The embedded catalog is indexed by id and by country once, up front
+        self._embedded_dishes = []
+        if self.embedded_catalog:
+            self._embedded_dishes = get_catalog_documents()
+            self._refresh_dish_sampler()
+
+    # Connection handling
+    @property
+    def client(self):
+        """MongoClient for the current process, created lazily.
+
+        MongoClient is not fork-safe, so a process forked after the client was
+        created (e.g. a server worker) gets its own instead of inheriting it.
+        """
+        if self._client is None or self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    # connect=False: nothing touches the network until the first operation
+                    self._client = MongoClient(
+                        self.uri,
+                        connect=False,
+                        # The profile listener adds commands to the requesting thread's capture
+                        event_listeners=[MongoCommandListener(), ProfileCommandListener()],
+                        **self.client_options
+                    )
+                    self._client_pid = os.getpid()
+        return self._client
+
+    @property
+    def server_selection_timeout(self):
+        """Seconds an operation may wait for a usable server (URI option, else client setting)"""
+        for name, values in parse_qs(urlsplit(self.uri).query).items():
+            if name.lower() == 'serverselectiontimeoutms':
+                return int(values[0]) / 1000
+        # pymongo's own default applies when neither sets it
+        return self.client_options.get('serverSelectionTimeoutMS', 30000) / 1000
+
+    @property
+    def db(self):
+        return self.client[self.database_name]
+
+    def _collection(self, name, read_preference):
+        """Collection handle with the given read preference, cached per client"""
+        client = self.client
+        key = (name, read_preference.name)
+        cached = self._collections.get(key)
+        if cached is None or cached[0] is not client:
+            collection = getattr(self.db, name).with_options(read_preference=read_preference)
+            cached = self._collections[key] = (client, collection)
+        return cached[1]
+
+    @property
+    def dishes(self):
+        # One-off catalog reads tolerate replication lag, so let secondaries serve them
+        return self._collection('dishes', ReadPreference.SECONDARY_PREFERRED)
+
+    @property
+    def primary_dishes(self):
+        # Reads that fill version-keyed caches (snapshot, sampler, indexes, payloads)
+        # follow writes, and a lagging secondary would pin stale data under the new version
+        return self._collection('dishes', ReadPreference.PRIMARY)
+
+    @property
+    def users(self):
+        return self._collection('users', ReadPreference.PRIMARY)
+
+    @property
+    def metadata(self):
+        # Shared counters such as the catalog version; always read from the primary
+        return self._collection('metadata', ReadPreference.PRIMARY)
+
+    @property
+    def user_recipes(self):
+        # Users must read their own writes: reads and writes stay on the primary
+        return self._collection('user_recipes', ReadPreference.PRIMARY)
+
+    def close(self):
+        """Close this process's MongoClient, if one was created"""
+        with self._client_lock:
+            if self._client is not None and self._client_pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._client_pid = None
+
+    def warm_up(self, max_dishes=None):
+        """Load the catalog caches so the first requests are served from memory.
+
+        Catalogs larger than max_dishes (default Config.WARM_UP_MAX_DISHES)
+        only get the snapshot; the rest loads on first use. Returns True if
+        everything was loaded.
+        """
+        if max_dishes is None:
+            max_dishes = Config.WARM_UP_MAX_DISHES
+        if self._catalog_snapshot()['total'] > max_dishes:
+            return False
+        self._refresh_dish_sampler()
+        self._refresh_catalog_index(self.search_index)
+        self._refresh_catalog_index(self.pantry_matcher)
+        if len(self.pantry_matcher) <= Config.SIMILAR_PRECOMPUTE_MAX_DISHES:
+            for _ in self.similar_dishes.precompute():
+                pass
+        return True
+
+    @property
+    def embedded_catalog(self):
+        """True when dishes are served from memory instead of MongoDB"""
+        return self.catalog_mode == self.CATALOG_EMBEDDED
+
+    def _check_catalog_writable(self):
+        if self.embedded_catalog:
+            raise RuntimeError("The dish catalog is read-only in embedded mode")
+
+    def ensure_indexes(self, collections=None):
+        """Create the indexes declared in INDEXES (no-op if they already exist).
+
+        collections limits this to some of INDEXES' collections. Saved recipes
+        from before the unique (user_id, dish_id) index may hold duplicates; if
+        the index build fails on them they are removed and the build retried.
+        """
+        for collection_name, indexes in self.INDEXES.items():
+            if collections is not None and collection_name not in collections:
+                continue
+            if collection_name == 'dishes' and self.embedded_catalog:
+                continue
+            try:
+                self.db[collection_name].create_indexes(indexes)
+            except OperationFailure as e:
+                if e.code != 11000 or collection_name != 'user_recipes':
+                    raise
+                self.dedupe_user_recipes()
+                self.db[collection_name].create_indexes(indexes)
+
+    def dedupe_user_recipes(self):
+        """Delete repeated (user_id, dish_id) recipes, keeping the first saved; returns the number deleted"""
+        pipeline = [
+            {"$group": {"_id": {"user_id": "$user_id", "dish_id": "$dish_id"},
+                        "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        deleted = 0
+        users = []
+        for group in self.user_recipes.aggregate(pipeline, allowDiskUse=True):
+            duplicates = sorted(group['ids'])[1:]
+            deleted += self.user_recipes.delete_many({"_id": {"$in": duplicates}}).deleted_count
+            users.append(group['_id']['user_id'])
+        self.bump_user_recipes_versions(users)
+        return deleted
+
+    # Catalog cache
+    @property
+    def catalog_version(self):
+        """Current catalog version, bumped on every dish write or seed.
+
+        The version lives in MongoDB so a write handled by one worker process
+        reaches the caches of all of them: each process rechecks it at most
+        every catalog_check_interval seconds.
+        """
+        self._sync_catalog_version()
+        return self.catalog_cache.version
+
+    def _sync_catalog_version(self):
+        """Adopt the shared catalog version if its recheck is due"""
+        if self.embedded_catalog or time.monotonic() < self._catalog_checked_at + self.catalog_check_interval:
+            return
+        # One thread rechecks; the others keep serving the version they have
+        if not self._catalog_check_lock.acquire(blocking=False):
+            return
+        try:
+            self._catalog_checked_at = time.monotonic()
+            shared = self.metadata.find_one({"_id": self.CATALOG_VERSION_ID}, {"version": 1})
+            if self.catalog_cache.advance(shared["version"] if shared else 0) is not None:
+                # Another process changed the catalog; which dishes is unknown, so drop every payload
+                self.dish_payloads.invalidate()
+        except PyMongoError:
+            pass  # keep serving the cached catalog; the next read retries
+        finally:
+            self._catalog_check_lock.release()
+
+    def _bump_shared_catalog_version(self):
+        shared = self.metadata.find_one_and_update(
+            {"_id": self.CATALOG_VERSION_ID},
+            {"$inc": {"version": 1}},
+            projection={"version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return shared["version"]
+
+    @property
+    def catalog_etag(self):
+        """ETag for responses built from the catalog, derived from the cached snapshot"""
+        return self._catalog_snapshot()['etag']
+
+    def bump_catalog_version(self, dish_id=None):
+        """Invalidate cached catalog data after the dishes collection changed.
+
+        Increments the shared version in MongoDB, so other processes reload
+        too. dish_id limits payload invalidation to that dish and lets up-to-date
+        catalog indexes (search, pantry) update just that dish, provided no other
+        write came in between; otherwise (or after a reseed) every pre-encoded
+        payload is dropped and the indexes are rebuilt on next use.
+        """
+        previous = self.catalog_cache.version
+        current = [index for index in (self.search_index, self.pantry_matcher) if index.version == previous]
+        version = self._bump_shared_catalog_version()
+        replaced = self.catalog_cache.advance(version)
+        if replaced is None:
+            # A later bump from this process already reloaded everything
+            return
+        if dish_id is None or replaced != version - 1:
+            self.dish_payloads.invalidate()
+            return
+        self.dish_payloads.invalidate(dish_id)
+        if not current:
+            return
+        dish = self.primary_dishes.find_one({"_id": ObjectId(dish_id)}, self.INDEX_PROJECTION)
+        for index in current:
+            if dish:
+                index.add(dish)
+            else:
+                index.remove(dish_id)
+            index.version = version
+        if self.pantry_matcher in current:
+            # Similar-dish lists live on the pantry bitsets; patch only the affected ones
+            self.similar_dishes.dish_removed(str(dish_id))
+            if dish:
+                self.similar_dishes.dish_added(str(dish_id))
+
+    def _load_country_counts(self):
+        """Count dishes per country with a single aggregation"""
+        if self.embedded_catalog:
+            return dict(Counter(dish['country'] for dish in self._embedded_dishes))
+        pipeline = [{"$group": {"_id": "$country", "count": {"$sum": 1}}}]
+        return {
+            row['_id']: row['count']
+            for row in self.primary_dishes.aggregate(pipeline)
+            if row['_id'] is not None
+        }
+
+    def get_statistics(self):
+        """Compute catalog and user statistics (used by the background StatisticsService)"""
+        counts = self._load_country_counts()
+        user_pipeline = [{"$group": {"_id": "$user_id"}}, {"$count": "users"}]
+        users = next(iter(self.user_recipes.aggregate(user_pipeline)), {}).get("users", 0)
+        return {
+            "dishes_per_country": counts,
+            "total_dishes": sum(counts.values()),
+            "total_countries": len(counts),
+            "total_users": users,
+            # Exact counts are not needed for monitoring; this reads collection metadata
+            "saved_recipes": self.user_recipes.estimated_document_count()
+        }
+
+    def _catalog_snapshot(self):
+        self._sync_catalog_version()
+        return self.catalog_cache.get(self._load_country_counts)
 
     # Country and Dish operations
     def get_countries(self):
         """Get list of all available countries"""
-        countries = self.dishes.distinct("country")
-        return sorted(countries)
+        return list(self._catalog_snapshot()['countries'])
+
+    def get_country_dish_counts(self):
+        """Get number of dishes per country"""
+        return dict(self._catalog_snapshot()['country_counts'])
 
     def get_random_dish_by_country(self, country):
         """Get a random dish from a specific country"""
-        pipeline = [
-            {"$match": {"country": country}},
-            {"$sample": {"size": 1}}
-        ]
-        
-        result = list(self.dishes.aggregate(pipeline))
-        if result:
-            result[0]['_id'] = str(result[0]['_id'])
-        return result[0] if result else None
+        dishes = self.get_random_dishes_by_country(country, count=1)
+        return dishes[0] if dishes else None
+
+    def _refresh_dish_sampler(self):
+        if self.embedded_catalog:
+            self.dish_sampler.refresh(self.catalog_version, lambda: self._embedded_dishes)
+            return
+        projection = self.DISH_PROJECTION if self.dish_sampler.store_documents else {"_id": 1, "country": 1}
+        self.dish_sampler.refresh(
+            self.catalog_version,
+            lambda: self.primary_dishes.find({}, projection)
+        )
+
+    def _refresh_catalog_index(self, index):
+        """Rebuild a catalog index (search_index, pantry_matcher) if the catalog version moved"""
+        version = self.catalog_version
+        if index.version == version:
+            return
+        if self.embedded_catalog:
+            loader = lambda: self._embedded_dishes
+        else:
+            loader = lambda: self.primary_dishes.find({}, self.INDEX_PROJECTION)
+        # One rebuild per version, however many requests arrive meanwhile
+        self.flights.do((type(index).__name__, version), lambda: index.rebuild(version, loader()))
+
+    def search_dishes(self, query='', ingredients=(), country=None, offset=0, limit=20):
+        """Full-text and ingredient search over the catalog.
+
+        Returns (total matches, ranked dish IDs for the page). The index is
+        built from the catalog on first use and kept in step with dish writes.
+        """
+        self._refresh_catalog_index(self.search_index)
+        return self.search_index.search(query, ingredients, country, offset, limit)
+
+    def get_similar_dishes(self, dish_id, limit=None):
+        """Up to limit (dish_id, jaccard) pairs of similar dishes from other countries.
+
+        Returns None for an unknown dish. Lists are precomputed at warm-up for
+        small catalogs, otherwise computed once on first request.
+        """
+        self._refresh_catalog_index(self.pantry_matcher)
+        neighbors = self.similar_dishes.neighbors(dish_id)
+        return None if neighbors is None else list(neighbors[:limit])
+
+    def match_pantry(self, pantry, limit=10, max_missing=None):
+        """Dishes that can be cooked (or nearly) from the pantry ingredients.
+
+        Returns (dishes sharing any ingredient, ranked results), fewest missing
+        ingredients first; see PantryMatcher.match.
+        """
+        self._refresh_catalog_index(self.pantry_matcher)
+        return self.pantry_matcher.match(pantry, limit, max_missing)
+
+    def get_random_dishes_by_country(self, country, count=1, exclude=()):
+        """Get up to count distinct random dishes from a country, skipping excluded IDs"""
+        self._refresh_dish_sampler()
+        picked = self.dish_sampler.sample(country, count, set(exclude))
+        if self.dish_sampler.store_documents:
+            return [dict(dish) for dish in picked]
+
+        if not picked:
+            return []
+        by_id = {}
+        for dish in self.dishes.find({"_id": {"$in": [ObjectId(dish_id) for dish_id in picked]}},
+                                     self.DISH_PROJECTION):
+            dish['_id'] = str(dish['_id'])
+            by_id[dish['_id']] = dish
+        return [by_id[dish_id] for dish_id in picked if dish_id in by_id]
 
     def get_dish_by_id(self, dish_id):
         """Get a specific dish by ID"""
-        dish = self.dishes.find_one({"_id": ObjectId(dish_id)})
+        if self.dish_sampler.store_documents:
+            self._refresh_dish_sampler()
+            dish = self.dish_sampler.get(dish_id)
+            if dish:
+                return dict(dish)
+            if self.embedded_catalog:
+                return None
+
+        dish = self.primary_dishes.find_one({"_id": ObjectId(dish_id)}, self.DISH_PROJECTION)
         if dish:
             dish['_id'] = str(dish['_id'])
         return dish
 
     def get_total_dish_count(self):
         """Get total number of dishes in database"""
-        return self.dishes.count_documents({})
+        return self._catalog_snapshot()['total']
 
     # CRUD operations for dishes
     def create_dish(self, dish_data):
         """Create a new dish"""
+        self._check_catalog_writable()
         result = self.dishes.insert_one(dish_data)
+        self.bump_catalog_version(result.inserted_id)
         return str(result.inserted_id)
 
     def update_dish(self, dish_id, dish_data):
         """Update an existing dish"""
+        self._check_catalog_writable()
         result = self.dishes.update_one(
             {"_id": ObjectId(dish_id)},
             {"$set": dish_data}
         )
+        if result.modified_count > 0:
+            self.bump_catalog_version(dish_id)
         return result.modified_count > 0
 
     def delete_dish(self, dish_id):
         """Delete a dish"""
+        self._check_catalog_writable()
         result = self.dishes.delete_one({"_id": ObjectId(dish_id)})
+        if result.deleted_count > 0:
+            self.bump_catalog_version(dish_id)
         return result.deleted_count > 0
 
+    def get_dishes_by_ids(self, dish_ids):
+        """Get dishes for several IDs at once, keyed by ID (missing IDs are left out)"""
+        found = {}
+        missing = []
+        if self.dish_sampler.store_documents:
+            self._refresh_dish_sampler()
+        for dish_id in dish_ids:
+            dish = self.dish_sampler.get(dish_id)
+            if dish:
+                found[dish_id] = dict(dish)
+            elif ObjectId.is_valid(dish_id) and not self.embedded_catalog:
+                missing.append(ObjectId(dish_id))
+
+        if missing:
+            for dish in self.primary_dishes.find({"_id": {"$in": missing}}, self.DISH_PROJECTION):
+                dish['_id'] = str(dish['_id'])
+                found[dish['_id']] = dish
+        return found
+
+    # Pre-encoded dish JSON
+    def get_random_dish_payloads(self, country, count=1, exclude=()):
+        """Like get_random_dishes_by_country, but as cached RawJSON payloads"""
+        generation = self.dish_payloads.generation
+        self._refresh_dish_sampler()
+        picked = self.dish_sampler.sample(country, count, set(exclude))
+        if not self.dish_sampler.store_documents:
+            payloads = self.get_dish_payloads(picked)
+            return [payloads[dish_id] for dish_id in picked if dish_id in payloads]
+        payloads = []
+        for dish in picked:
+            payload = self.dish_payloads.get(dish['_id'])
+            if payload is None:
+                payload = self.dish_payloads.store(dish, generation)
+            payloads.append(payload)
+        return payloads
+
+    def get_dish_payloads(self, dish_ids):
+        """Cached RawJSON payloads for several dish IDs, keyed by ID (missing IDs are left out)"""
+        self._sync_catalog_version()
+        generation = self.dish_payloads.generation
+        payloads = {}
+        missing = []
+        for dish_id in dish_ids:
+            payload = self.dish_payloads.get(dish_id)
+            if payload is None:
+                missing.append(dish_id)
+            else:
+                payloads[dish_id] = payload
+        if missing:
+            for dish_id, dish in self.get_dishes_by_ids(missing).items():
+                payloads[dish_id] = self.dish_payloads.store(dish, generation)
+        return payloads
+
     def get_all_dish_ids(self):
         """Get array of all dish IDs"""
+        if self.embedded_catalog:
+            return [dish['_id'] for dish in self._embedded_dishes]
         dishes = self.dishes.find({}, {"_id": 1})
         return [str(dish["_id"]) for dish in dishes]
 
     # User recipe operations
     def save_dish_to_user_recipes(self, user_id, dish_id, custom_name=None):
-        """Save a dish to user's recipes"""
-        # Check if recipe already exists
-        existing = self.user_recipes.find_one({
-            "user_id": user_id,
-            "dish_id": dish_id
-        })
-        
-        if existing:
-            return None  # Already saved
-        
-        # Get the dish details
+        """Save a dish to user's recipes.
+
+        Returns None if the dish does not exist. Duplicates are detected by the
+        unique (user_id, dish_id) index, so the insert raises DuplicateKeyError
+        when the recipe is already saved.
+        """
+        # Get the dish details (served from memory once the catalog is loaded)
         dish = self.get_dish_by_id(dish_id)
         if not dish:
             return None  # Dish not found
         
+        recipe_data = self._build_recipe(user_id, dish, custom_name)
+        
+        result = self.user_recipes.insert_one(recipe_data)
+        version = self.bump_user_recipes_version(user_id)
+        # insert_one filled in recipe_data's _id
+        self.recipe_cache.update(user_id, version, lambda recipes: insert_recipe(recipes, recipe_data))
+        return str(result.inserted_id)
+
+    def _build_recipe(self, user_id, dish, custom_name=None):
+        """Build a user_recipes document for the configured storage mode"""
         recipe_data = {
             "user_id": user_id,
-            "dish_id": dish_id,
+            "dish_id": dish['_id'],
             "custom_name": custom_name or dish['name'],
-            "original_dish": dish,
             "saved_at": None  # You might want to add timestamp
         }
-        
-        result = self.user_recipes.insert_one(recipe_data)
-        return str(result.inserted_id)
+        if self.recipe_storage != self.RECIPE_STORAGE_REFERENCE:
+            recipe_data["original_dish"] = dish
+        return recipe_data
 
     def get_user_recipes(self, user_id):
         """Get all saved recipes for a user"""
-        recipes = list(self.user_recipes.find({"user_id": user_id}))
+        return list(self.iter_user_recipes(user_id))
+
+    def iter_user_recipes(self, user_id, after=None, limit=None, fields=None, encoded_dishes=False,
+                          version=None):
+        """Yield a user's recipes in _id order as the cursor returns them.
+
+        after is the last recipe ID of the previous page (keyset pagination),
+        limit caps the number of documents and fields restricts the projection.
+        Reference-stored recipes get original_dish filled in from the catalog,
+        one batched lookup per HYDRATE_BATCH_SIZE recipes; with encoded_dishes
+        it is attached as a cached RawJSON payload. Documents are yielded as
+        stored, ObjectIds included (the app's JSON provider encodes them).
+
+        Unprojected reads go through recipe_cache, validated against the user's
+        recipes version (pass version if the caller already read it). A full
+        read on a cache miss loads the list once for all concurrent callers.
+        """
+        cacheable = not fields and self.recipe_cache.enabled
+        if cacheable:
+            if version is None:
+                version = self.get_user_recipes_version(user_id)
+            cached = self.recipe_cache.get(user_id, version)
+            if cached is None and not after and not limit:
+                cached = self.flights.do(
+                    ('user_recipes', user_id, version),
+                    lambda: self._load_user_recipes(user_id, version)
+                )
+            if cached is not None:
+                if after:
+                    after_id = ObjectId(after)
+                    cached = (recipe for recipe in cached if recipe['_id'] > after_id)
+                # Copies, since hydration attaches original_dish to each document
+                recipes = (dict(recipe) for recipe in itertools.islice(cached, limit))
+                yield from self._hydrate_stream(recipes, True, encoded_dishes)
+                return
+
+        query = {"user_id": user_id}
+        if after:
+            query["_id"] = {"$gt": ObjectId(after)}
+        hydrate = not fields or any(field.split('.')[0] == 'original_dish' for field in fields)
+        projection = self.RECIPE_PROJECTION
+        if fields:
+            projection = {field: 1 for field in fields}
+            if hydrate:
+                projection['dish_id'] = 1
+
+        cursor = self.user_recipes.find(query, projection).sort("_id", ASCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        yield from self._hydrate_stream(cursor, hydrate, encoded_dishes)
+
+    def _load_user_recipes(self, user_id, version):
+        """Read a user's whole recipe list into recipe_cache (tagged with version)"""
+        recipes = list(self.user_recipes.find({"user_id": user_id}, self.RECIPE_PROJECTION).sort("_id", ASCENDING))
+        self.recipe_cache.put(user_id, version, recipes)
+        return recipes
+
+    def _hydrate_stream(self, recipes, hydrate, encoded_dishes):
+        batch = []
+        for recipe in recipes:
+            if not hydrate:
+                yield recipe
+                continue
+            batch.append(recipe)
+            if len(batch) >= self.HYDRATE_BATCH_SIZE:
+                yield from self._hydrate_recipes(batch, encoded_dishes)
+                batch = []
+        if batch:
+            yield from self._hydrate_recipes(batch, encoded_dishes)
+
+    def _hydrate_recipes(self, recipes, encoded_dishes=False):
+        """Attach original_dish to reference-stored recipes with one batched lookup"""
+        dish_ids = {recipe['dish_id'] for recipe in recipes
+                    if 'original_dish' not in recipe and recipe.get('dish_id')}
+        dishes = {}
+        if dish_ids:
+            dishes = self.get_dish_payloads(dish_ids) if encoded_dishes else self.get_dishes_by_ids(dish_ids)
         for recipe in recipes:
-            recipe['_id'] = str(recipe['_id'])
-            if 'original_dish' in recipe and '_id' in recipe['original_dish']:
-                recipe['original_dish']['_id'] = str(recipe['original_dish']['_id'])
+            if 'original_dish' not in recipe and recipe.get('dish_id') in dishes:
+                recipe['original_dish'] = dishes[recipe['dish_id']]
         return recipes
 
+    def migrate_recipes_to_references(self, batch_size=500):
+        """Convert embedded recipes to reference storage in batches.
+
+        Walks user_recipes by _id so it can run alongside live traffic and be
+        resumed at any point. The embedded copy is only dropped when the dish
+        still exists in the catalog. Yields (scanned, converted) after each batch.
+        """
+        scanned = 0
+        converted = 0
+        last_id = None
+        while True:
+            query = {"original_dish": {"$exists": True}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = list(
+                self.user_recipes.find(query, {"_id": 1, "dish_id": 1})
+                .sort("_id", ASCENDING)
+                .limit(batch_size)
+            )
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+            scanned += len(batch)
+
+            dishes = self.get_dishes_by_ids({recipe.get('dish_id') for recipe in batch if recipe.get('dish_id')})
+            operations = [
+                UpdateOne({"_id": recipe['_id']}, {"$unset": {"original_dish": ""}})
+                for recipe in batch
+                if recipe.get('dish_id') in dishes
+            ]
+            if operations:
+                converted += self.user_recipes.bulk_write(operations, ordered=False).modified_count
+                self.recipe_cache.invalidate()
+            yield scanned, converted
+
+    # Per-user recipe versions (used for ETags)
+    def get_user_recipes_version(self, user_id):
+        """Current version of a user's saved recipes, 0 if never written"""
+        user = self.users.find_one({"_id": user_id}, {"recipes_version": 1})
+        return user.get("recipes_version", 0) if user else 0
+
+    def bump_user_recipes_version(self, user_id):
+        """Increment a user's recipes version after their recipes changed, returning the new one.
+
+        Versions live in MongoDB rather than in memory so every worker process
+        agrees on them. Bump after the write: a reader that sees the old version
+        with new content just refetches once.
+        """
+        user = self.users.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"recipes_version": 1}},
+            projection={"recipes_version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return user["recipes_version"]
+
+    def bump_user_recipes_versions(self, user_ids):
+        """Increment the recipes version of many users at once, dropping their cached recipes"""
+        operations = []
+        for user_id in dict.fromkeys(user_ids):
+            operations.append(UpdateOne({"_id": user_id}, {"$inc": {"recipes_version": 1}}, upsert=True))
+            self.recipe_cache.invalidate(user_id)
+        if operations:
+            self.users.bulk_write(operations, ordered=False)
+
     def get_user_recipe_ids(self, user_id):
         """Get array of user's saved recipe IDs"""
         recipes = self.user_recipes.find({"user_id": user_id}, {"_id": 1})
         return [str(recipe["_id"]) for recipe in recipes]
 
+    def bulk_update_user_recipes(self, user_id, save=(), delete=()):
+        """Save and delete many recipes with one unordered bulk_write.
+
+        save is a list of (dish_id, custom_name) pairs and delete a list of
+        recipe IDs. Returns per-item results in request order, each with a
+        status of saved, duplicate, not_found, deleted or invalid.
+        """
+        dishes = self.get_dishes_by_ids([dish_id for dish_id, _ in save])
+        valid_delete_ids = [ObjectId(recipe_id) for recipe_id in delete if ObjectId.is_valid(recipe_id)]
+        existing = set()
+        if valid_delete_ids:
+            existing = {
+                str(recipe['_id'])
+                for recipe in self.user_recipes.find(
+                    {"_id": {"$in": valid_delete_ids}, "user_id": user_id},
+                    {"_id": 1}
+                )
+            }
+
+        operations = []
+        # Index into save_results/delete_results for every queued operation
+        operation_items = []
+        save_results = []
+        for dish_id, custom_name in save:
+            dish = dishes.get(dish_id)
+            if not dish:
+                save_results.append({"dishid": dish_id, "status": "not_found"})
+                continue
+            recipe_id = ObjectId()
+            recipe_data = self._build_recipe(user_id, dish, custom_name)
+            recipe_data["_id"] = recipe_id
+            operations.append(InsertOne(recipe_data))
+            save_results.append({"dishid": dish_id, "status": "saved", "recipeId": str(recipe_id)})
+            operation_items.append(save_results[-1])
+
+        delete_results = []
+        for recipe_id in delete:
+            if not ObjectId.is_valid(recipe_id):
+                delete_results.append({"recipeId": recipe_id, "status": "invalid"})
+            elif recipe_id not in existing:
+                delete_results.append({"recipeId": recipe_id, "status": "not_found"})
+            else:
+                operations.append(DeleteOne({"_id": ObjectId(recipe_id), "user_id": user_id}))
+                delete_results.append({"recipeId": recipe_id, "status": "deleted"})
+                operation_items.append(delete_results[-1])
+
+        if operations:
+            try:
+                self.user_recipes.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    if error.get('code') != 11000:
+                        raise
+                    item = operation_items[error['index']]
+                    item['status'] = "duplicate"
+                    item.pop('recipeId', None)
+            finally:
+                self.bump_user_recipes_versions([user_id])
+
+        return {"save": save_results, "delete": delete_results}
+
     def delete_user_recipe(self, user_id, recipe_id):
         """Delete a saved recipe"""
         result = self.user_recipes.delete_one({
             "_id": ObjectId(recipe_id),
             "user_id": user_id
         })
+        if result.deleted_count > 0:
+            version = self.bump_user_recipes_version(user_id)
+            self.recipe_cache.update(user_id, version, lambda recipes: [
+                recipe for recipe in recipes if str(recipe['_id']) != recipe_id
+            ])
         return result.deleted_count > 0
 
     # ADDED: Missing update method for the PUT route
@@ -121,6 +1071,11 @@ class Database:
             {"_id": ObjectId(recipe_id), "user_id": user_id},
             {"$set": update_data}
         )
+        if result.modified_count > 0:
+            version = self.bump_user_recipes_version(user_id)
+            self.recipe_cache.update(user_id, version, lambda recipes: apply_recipe_update(
+                recipes, recipe_id, update_data
+            ))
         return result.modified_count > 0
 
     # Legacy method for backward compatibility - now uses SeedManager
@@ -0,0 +1,188 @@
+"""
+GeoDish Pantry Matcher
+Scores every dish against a pantry at once using ingredient bitsets
+"""
+import threading
+
+from .search import normalize
+from .singleflight import acquire
+
+
+def ingredient_key(name):
+    """Normalized ingredient name, singularized so 'Tomatoes' matches 'tomato'"""
+    key = ' '.join(normalize(name).split())
+    if key.endswith('ies') and len(key) > 4:
+        return key[:-3] + 'y'
+    if key.endswith('oes') and len(key) > 4:
+        return key[:-2]
+    if key.endswith('s') and not key.endswith('ss') and len(key) > 3:
+        return key[:-1]
+    return key
+
+
+def iter_bits(mask):
+    """Yield the indexes of the set bits of mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class PantryMatcher:
+    """Ingredient-by-dish bitset matrix of the catalog.
+
+    Each dish gets a slot (bit position); each ingredient keeps a Python int
+    with the bits of the dishes that use it, and dishes are also grouped into
+    bitsets by ingredient count. Matching a pantry adds the pantry ingredients'
+    bitsets as bit-sliced counters, so every dish is scored with a handful of
+    big-integer operations instead of a loop over dishes. add() and remove()
+    update single slots between full rebuilds.
+    """
+
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self.version = None
+        # Counts full rebuilds, so dependent caches (SimilarityIndex) know to reset
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._ingredients = {}  # ingredient key -> dish bitset
+        self._by_size = {}  # ingredient count -> dish bitset
+        self._slots = {}  # dish_id -> slot
+        self._dish_ids = []  # slot -> dish_id (None when free)
+        self._dish_ingredients = {}  # dish_id -> {ingredient key: ingredient as written}
+        self._dish_countries = {}  # dish_id -> country
+        self._countries = {}  # country -> dish bitset
+        self._free_slots = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def rebuild(self, version, dishes):
+        """Replace the matrix with dishes, tagged with the catalog version"""
+        with acquire(self._lock, self.wait_timeout, "the pantry matcher"):
+            self._clear()
+            for dish in dishes:
+                self._add(dish)
+            self.version = version
+            self.rebuilds += 1
+
+    def add(self, dish):
+        """Insert (or replace) one dish document"""
+        with acquire(self._lock, self.wait_timeout, "the pantry matcher"):
+            self._remove(str(dish['_id']))
+            self._add(dish)
+
+    def remove(self, dish_id):
+        with acquire(self._lock, self.wait_timeout, "the pantry matcher"):
+            self._remove(str(dish_id))
+
+    def match(self, pantry, limit=10, max_missing=None):
+        """Best dishes for a pantry: fewest missing ingredients, then highest coverage.
+
+        Only dishes sharing at least one ingredient with the pantry qualify.
+        Returns (number of qualifying dishes, [result dicts]) where each result
+        has dish_id, matched, missing, coverage and missing_ingredients.
+        """
+        keys = {ingredient_key(item) for item in pantry}
+        with acquire(self._lock, self.wait_timeout, "the pantry matcher"):
+            candidates, planes = self._overlap(keys)
+            if not candidates:
+                return 0, []
+
+            results = []
+            sizes = sorted((size for size, bits in self._by_size.items() if bits & candidates), reverse=True)
+            largest = sizes[0] if sizes else 0
+            most_missing = largest - 1 if max_missing is None else min(max_missing, largest - 1)
+            for missing in range(most_missing + 1):
+                # For a fixed missing count, bigger dishes have the higher coverage
+                for size in sizes:
+                    matched = size - missing
+                    if matched < 1:
+                        continue
+                    mask = self._by_size[size] & candidates & self._count_equals(planes, matched)
+                    for slot in iter_bits(mask):
+                        dish_id = self._dish_ids[slot]
+                        results.append({
+                            "dish_id": dish_id,
+                            "matched": matched,
+                            "missing": missing,
+                            "coverage": round(matched / size, 3),
+                            "missing_ingredients": [
+                                name for key, name in self._dish_ingredients[dish_id].items()
+                                if key not in keys
+                            ]
+                        })
+                        if len(results) == limit:
+                            return candidates.bit_count(), results
+            return candidates.bit_count(), results
+
+    def _overlap(self, keys):
+        """Dishes sharing any of keys, and bit-sliced counts of how many they share.
+
+        Bit j of planes[i] is bit i of dish j's count, so the counts of every
+        dish are summed with ripple-carry adds over whole bitsets.
+        """
+        candidates = 0
+        planes = []
+        for key in keys:
+            carry = self._ingredients.get(key, 0)
+            candidates |= carry
+            for i, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[i], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        return candidates, planes
+
+    @staticmethod
+    def _count_equals(planes, value):
+        """Bitset of dishes whose bit-sliced count equals value"""
+        if value >> len(planes):
+            return 0
+        mask = -1
+        for i, plane in enumerate(planes):
+            mask &= plane if value >> i & 1 else ~plane
+        return mask
+
+    def _add(self, dish):
+        dish_id = str(dish['_id'])
+        ingredients = {}
+        for name in dish.get('ingredients') or []:
+            ingredients.setdefault(ingredient_key(name), name)
+        if not ingredients:
+            return
+        slot = self._free_slots.pop() if self._free_slots else len(self._dish_ids)
+        if slot == len(self._dish_ids):
+            self._dish_ids.append(dish_id)
+        else:
+            self._dish_ids[slot] = dish_id
+        self._slots[dish_id] = slot
+        self._dish_ingredients[dish_id] = ingredients
+        bit = 1 << slot
+        for key in ingredients:
+            self._ingredients[key] = self._ingredients.get(key, 0) | bit
+        self._by_size[len(ingredients)] = self._by_size.get(len(ingredients), 0) | bit
+        country = dish.get('country')
+        self._dish_countries[dish_id] = country
+        self._countries[country] = self._countries.get(country, 0) | bit
+
+    def _remove(self, dish_id):
+        slot = self._slots.pop(dish_id, None)
+        if slot is None:
+            return
+        keys = self._dish_ingredients.pop(dish_id)
+        clear = ~(1 << slot)
+        for key in keys:
+            remaining = self._ingredients[key] & clear
+            if remaining:
+                self._ingredients[key] = remaining
+            else:
+                del self._ingredients[key]
+        self._by_size[len(keys)] &= clear
+        self._countries[self._dish_countries.pop(dish_id)] &= clear
+        self._dish_ids[slot] = None
+        self._free_slots.append(slot)
@@ -0,0 +1,244 @@
+"""
+GeoDish Request Profiling
+Opt-in stack sampling and MongoDB timelines per request, with slow requests
+captured to a bounded on-disk ring buffer
+"""
+from pymongo import monitoring
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from .metrics import IGNORED_COMMANDS
+
+# Request header carrying a profiling token: "<expiry unix time>.<hex HMAC-SHA256 of the expiry>"
+PROFILE_HEADER = 'X-GeoDish-Profile'
+
+_current = threading.local()
+
+
+def current_capture():
+    """The capture recording the request running on this thread, if any"""
+    return getattr(_current, 'capture', None)
+
+
+def sign_profile_token(secret, expires):
+    expires = str(int(expires))
+    return f"{expires}.{hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()}"
+
+
+def verify_profile_token(secret, token):
+    """True if token was signed with secret and has not expired"""
+    if not secret or not token:
+        return False
+    expires, _, _ = token.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign_profile_token(secret, expires), token)
+
+
+class StackSampler:
+    """Samples one thread's Python stack every interval seconds from a helper thread.
+
+    Stacks are counted in collapsed form (root;...;leaf), ready for
+    flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='geodish-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+
+class Capture:
+    """What is recorded for one request: MongoDB timeline and optionally stack samples"""
+
+    def __init__(self, capture_id, sampler=None):
+        self.id = capture_id
+        self.sampler = sampler
+        self.created = time.time()
+        self.started = time.perf_counter()
+        self.timeline = []
+        self._pending = {}  # (connection, request_id) -> timeline entry
+
+    @property
+    def profiled(self):
+        return self.sampler is not None
+
+    def command_started(self, event):
+        entry = {
+            "command": event.command_name,
+            "collection": event.command.get('collection' if event.command_name == 'getMore' else event.command_name),
+            "start_ms": round((time.perf_counter() - self.started) * 1000, 3)
+        }
+        if not isinstance(entry["collection"], str):
+            entry["collection"] = ''
+        self.timeline.append(entry)
+        self._pending[(event.connection_id, event.request_id)] = entry
+
+    def command_finished(self, event, outcome):
+        entry = self._pending.pop((event.connection_id, event.request_id), None)
+        if entry is not None:
+            entry["duration_ms"] = round(event.duration_micros / 1000, 3)
+            entry["outcome"] = outcome
+
+
+class ProfileCommandListener(monitoring.CommandListener):
+    """pymongo listener adding commands to the current thread's capture.
+
+    pymongo calls listeners on the thread that runs the command, so the
+    thread-local capture is the request that issued it.
+    """
+
+    def started(self, event):
+        capture = current_capture()
+        if capture is not None and event.command_name not in IGNORED_COMMANDS:
+            capture.command_started(event)
+
+    def succeeded(self, event):
+        capture = current_capture()
+        if capture is not None:
+            capture.command_finished(event, 'success')
+
+    def failed(self, event):
+        capture = current_capture()
+        if capture is not None:
+            capture.command_finished(event, 'failure')
+
+
+class CaptureStore:
+    """Ring buffer of capture files: writing one beyond max_captures deletes the oldest.
+
+    File names start with the capture time in milliseconds, so name order is
+    age order across every worker process sharing the directory.
+    """
+
+    def __init__(self, directory, max_captures=50):
+        self.directory = directory
+        self.max_captures = max_captures
+
+    def save(self, capture_id, document):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{capture_id}.json")
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(temporary, path)
+        for name in self._names()[:-self.max_captures]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+
+    def list(self):
+        """Summaries of stored captures, newest first"""
+        captures = []
+        for name in reversed(self._names()):
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    document = json.load(f)
+            except (OSError, ValueError):
+                continue
+            captures.append({key: document.get(key) for key in
+                             ('id', 'created', 'method', 'route', 'path', 'status', 'duration_ms',
+                              'reason', 'mongo_commands', 'samples')})
+        return captures
+
+    def path(self, capture_id):
+        """Path of a stored capture, or None (also for IDs that are not plain file names)"""
+        if not capture_id or os.path.basename(capture_id) != capture_id or capture_id.startswith('.'):
+            return None
+        path = os.path.join(self.directory, f"{capture_id}.json")
+        return path if os.path.exists(path) else None
+
+    def _names(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        except FileNotFoundError:
+            return []
+
+
+class RequestProfiler:
+    """Decides what to record per request and stores the captures worth keeping.
+
+    With slow_ms > 0 every request records its MongoDB timeline (a list
+    append per command) and is stored if it took at least slow_ms. Stack
+    sampling runs only when profile_all is set or the request carries a
+    valid signed PROFILE_HEADER; such requests are always stored.
+    """
+
+    def __init__(self, store, slow_ms=1000, profile_all=False, secret='', interval=0.005):
+        self.store = store
+        self.slow_ms = slow_ms
+        self.profile_all = profile_all
+        self.secret = secret
+        self.interval = interval
+        self.captured = 0
+        self._ids = itertools.count()
+
+    def begin(self, token=None):
+        """Start recording the current thread's request; None when nothing would be kept"""
+        profiled = self.profile_all or verify_profile_token(self.secret, token)
+        if not profiled and self.slow_ms <= 0:
+            return None
+        capture_id = f"{int(time.time() * 1000)}-{os.getpid()}-{next(self._ids)}"
+        sampler = StackSampler(threading.get_ident(), self.interval).start() if profiled else None
+        capture = _current.capture = Capture(capture_id, sampler)
+        return capture
+
+    def end(self, capture, method, route, path, status):
+        """Stop recording; returns the capture ID if it was stored"""
+        _current.capture = None
+        duration_ms = (time.perf_counter() - capture.started) * 1000
+        if capture.sampler is not None:
+            capture.sampler.stop()
+        slow = self.slow_ms > 0 and duration_ms >= self.slow_ms
+        if not (capture.profiled or slow):
+            return None
+        self.store.save(capture.id, {
+            "id": capture.id,
+            "created": round(capture.created, 3),
+            "method": method,
+            "route": route,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+            "reason": 'slow' if slow else 'requested',
+            "mongo_commands": len(capture.timeline),
+            "mongo_ms": round(sum(entry.get("duration_ms", 0) for entry in capture.timeline), 3),
+            "timeline": capture.timeline,
+            "samples": capture.sampler.samples if capture.sampler else 0,
+            "sample_interval_ms": self.interval * 1000 if capture.sampler else None,
+            "stacks": capture.sampler.stacks if capture.sampler else {}
+        })
+        self.captured += 1
+        return capture.id
@@ -0,0 +1,182 @@
+"""
+GeoDish Search
+In-memory inverted index over dish names, ingredients and instructions
+"""
+import bisect
+import math
+import re
+import threading
+import unicodedata
+
+from .singleflight import acquire
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Relative weight of a term occurrence in each field
+FIELD_WEIGHTS = {"name": 3.0, "ingredients": 2.0, "instructions": 1.0}
+
+# Query tokens at least this long also match longer terms they are a prefix of
+MIN_PREFIX_LENGTH = 2
+
+# A prefix match counts for less than the exact term
+PREFIX_MATCH_WEIGHT = 0.5
+
+
+def normalize(text):
+    """Lowercase and strip accents, so 'Crème Brûlée' matches 'creme brulee'"""
+    decomposed = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def dish_field_tokens(dish):
+    """Tokens per indexed field of a dish document"""
+    ingredients = dish.get('ingredients') or []
+    return {
+        "name": tokenize(dish.get('name', '')),
+        "ingredients": tokenize(' '.join(str(ingredient) for ingredient in ingredients)),
+        "instructions": tokenize(dish.get('instructions', ''))
+    }
+
+
+class SearchIndex:
+    """Inverted index of catalog dishes with prefix matching and ranked results.
+
+    Postings map term -> {dish_id: weighted term frequency} across all fields,
+    with a separate ingredient-only postings map for ingredient filters. The
+    sorted term lists make a prefix lookup two bisects. add() and remove()
+    keep the index current between full rebuilds.
+    """
+
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self.version = None
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._postings = {}
+        self._ingredient_postings = {}
+        self._terms = []
+        self._ingredient_terms = []
+        self._countries = {}  # dish_id -> normalized country
+        self._names = {}  # dish_id -> normalized name, for stable ordering of ties
+
+    def __len__(self):
+        return len(self._countries)
+
+    def rebuild(self, version, dishes):
+        """Replace the index contents with dishes, tagged with the catalog version"""
+        with acquire(self._lock, self.wait_timeout, "the search index"):
+            self._clear()
+            for dish in dishes:
+                self._add(dish)
+            self._terms.sort()
+            self._ingredient_terms.sort()
+            self.version = version
+
+    def add(self, dish):
+        """Index (or re-index) one dish document"""
+        with acquire(self._lock, self.wait_timeout, "the search index"):
+            self._remove(str(dish['_id']))
+            self._add(dish, keep_sorted=True)
+
+    def remove(self, dish_id):
+        with acquire(self._lock, self.wait_timeout, "the search index"):
+            self._remove(str(dish_id))
+
+    def search(self, query='', ingredients=(), country=None, offset=0, limit=20):
+        """Rank dishes matching every query token, ingredient and the country.
+
+        Returns (total matches, dish IDs for the requested page).
+        """
+        with acquire(self._lock, self.wait_timeout, "the search index"):
+            scores = None
+            for token in tokenize(query):
+                token_scores = self._match(token, self._postings, self._terms)
+                scores = token_scores if scores is None else {
+                    dish_id: score + token_scores[dish_id]
+                    for dish_id, score in scores.items() if dish_id in token_scores
+                }
+                if not scores:
+                    return 0, []
+
+            for ingredient in ingredients:
+                for token in tokenize(ingredient):
+                    matches = self._match(token, self._ingredient_postings, self._ingredient_terms)
+                    if scores is None:
+                        scores = dict.fromkeys(matches, 0.0)
+                    else:
+                        scores = {dish_id: score for dish_id, score in scores.items() if dish_id in matches}
+                    if not scores:
+                        return 0, []
+
+            if country:
+                wanted = normalize(country)
+                if scores is None:
+                    scores = {dish_id: 0.0 for dish_id, value in self._countries.items() if value == wanted}
+                else:
+                    scores = {dish_id: score for dish_id, score in scores.items()
+                              if self._countries.get(dish_id) == wanted}
+
+            if not scores:
+                return 0, []
+            ranked = sorted(scores, key=lambda dish_id: (-scores[dish_id], self._names.get(dish_id, '')))
+            return len(ranked), ranked[offset:offset + limit]
+
+    def _match(self, token, postings, terms):
+        """Scores of dishes containing token, or a longer term starting with it"""
+        matched = [token] if token in postings else []
+        if len(token) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_left(terms, token)
+            end = bisect.bisect_left(terms, token + '\uffff')
+            matched.extend(term for term in terms[start:end] if term != token)
+
+        total = len(self._countries) or 1
+        scores = {}
+        for term in matched:
+            term_postings = postings[term]
+            weight = math.log(1 + total / len(term_postings))
+            if term != token:
+                weight *= PREFIX_MATCH_WEIGHT
+            for dish_id, frequency in term_postings.items():
+                scores[dish_id] = max(scores.get(dish_id, 0.0), frequency * weight)
+        return scores
+
+    def _add(self, dish, keep_sorted=False):
+        dish_id = str(dish['_id'])
+        self._countries[dish_id] = normalize(dish.get('country', ''))
+        self._names[dish_id] = normalize(dish.get('name', ''))
+        fields = dish_field_tokens(dish)
+        for field, tokens in fields.items():
+            for token in tokens:
+                self._post(self._postings, self._terms, token, dish_id, FIELD_WEIGHTS[field], keep_sorted)
+        for token in fields["ingredients"]:
+            self._post(self._ingredient_postings, self._ingredient_terms, token, dish_id, 1.0, keep_sorted)
+
+    @staticmethod
+    def _post(postings, terms, token, dish_id, weight, keep_sorted):
+        term_postings = postings.get(token)
+        if term_postings is None:
+            term_postings = postings[token] = {}
+            if keep_sorted:
+                bisect.insort(terms, token)
+            else:
+                terms.append(token)
+        term_postings[dish_id] = term_postings.get(dish_id, 0.0) + weight
+
+    def _remove(self, dish_id):
+        if self._countries.pop(dish_id, None) is None:
+            return
+        self._names.pop(dish_id, None)
+        for postings, terms in ((self._postings, self._terms),
+                                (self._ingredient_postings, self._ingredient_terms)):
+            # Dish writes are rare, so scan the postings rather than keep each dish's terms
+            for term in [term for term, term_postings in postings.items() if dish_id in term_postings]:
+                del postings[term][dish_id]
+                if not postings[term]:
+                    del postings[term]
+                    terms.pop(bisect.bisect_left(terms, term))
@@ -2,45 +2,133 @@
 GeoDish Seed Manager
 Handles all seeding operations
 """
-from .data import GEODISH_SEED_DATA, get_country_count, get_dish_count, get_countries  # Add get_countries here
+from .data import get_country_count, get_dish_count, get_countries
+from .data import get_catalog_documents
+from .data.synthetic import read_jsonl
+from bson import ObjectId
+from pymongo import UpdateOne
+import hashlib
+import itertools
+import json
 import logging
+import time
 logger = logging.getLogger(__name__)
 
+def batched(iterable, size):
+    """Yield lists of up to size items from any iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def dish_content_hash(dish):
+    """Stable hash of a dish's content, used to skip unchanged dishes when re-seeding"""
+    encoded = json.dumps(dish, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
 class SeedManager:
     def __init__(self, db):
         self.db = db
-        
-    def is_database_seeded(self):
-        """Check if database already contains data"""
-        return self.db.dishes.count_documents({}) > 0
+        self._seed_statistics = None
         
     def seed_database(self, force=False):
-        """Seed database with complete data"""
-        if not force and self.is_database_seeded():
-            countries = len(self.db.get_countries())
-            dishes = self.db.dishes.count_documents({})
-            return f"Database already seeded with {countries} countries and {dishes} dishes"
-        
-        # Clear existing data if force seeding
-        if force:
-            self.db.dishes.delete_many({})
-            self.db.user_recipes.delete_many({})
-            logger.info("Cleared existing database data for force seed")
-        
-        # Insert all seed data
-        self.db.dishes.insert_many(GEODISH_SEED_DATA.copy())
-        
+        """Seed database with complete data.
+
+        Seeding is incremental: dishes are upserted by (name, country) and
+        unchanged ones are skipped, so saved recipes and dish IDs survive.
+        force rewrites every dish even when its content hash matches.
+        """
+        if self.db.embedded_catalog:
+            return f"Catalog is embedded with {self.db.get_total_dish_count()} dishes; nothing to seed"
+
+        stats = self.seed_dishes(get_catalog_documents(), force=force)
         countries = get_country_count()
-        dishes = get_dish_count()
-        
-        logger.info(f"Successfully seeded database with {countries} countries and {dishes} dishes")
-        return f"Successfully seeded {dishes} dishes from {countries} countries"
-        
+
+        logger.info("Seeded database from %s countries: %s", countries, stats)
+        return (f"Successfully seeded {stats['processed']} dishes from {countries} countries "
+                f"({stats['inserted']} new, {stats['updated']} updated, {stats['unchanged']} unchanged)")
+
+    def seed_dishes(self, dishes, batch_size=1000, force=False):
+        """Upsert dishes from any iterable (e.g. a generator or JSONL reader) in batches.
+
+        Each dish is matched on its natural key (name, country) and stored with
+        a content hash; dishes whose hash is unchanged are not written. An _id
+        on the source record is only used when the dish is first inserted.
+        Returns processed/inserted/updated/unchanged counts and throughput.
+        """
+        self.db.ensure_indexes(['dishes'])
+        stats = {"processed": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+        started = time.perf_counter()
+
+        for batch in batched(dishes, batch_size):
+            keys = {(dish['name'], dish['country']) for dish in batch}
+            existing = {}
+            if not force:
+                # From the primary: a lagging secondary's hash could skip a needed write
+                cursor = self.db.primary_dishes.find(
+                    {"country": {"$in": list({country for _, country in keys})},
+                     "name": {"$in": list({name for name, _ in keys})}},
+                    {"name": 1, "country": 1, "content_hash": 1}
+                )
+                existing = {(dish['name'], dish['country']): dish.get('content_hash') for dish in cursor}
+
+            operations = []
+            for dish in batch:
+                content = {key: value for key, value in dish.items() if key not in ('_id', 'content_hash')}
+                content_hash = dish_content_hash(content)
+                if existing.get((dish['name'], dish['country'])) == content_hash:
+                    stats["unchanged"] += 1
+                    continue
+                update = {"$set": dict(content, content_hash=content_hash)}
+                if isinstance(dish.get('_id'), str) and ObjectId.is_valid(dish['_id']):
+                    update["$setOnInsert"] = {"_id": ObjectId(dish['_id'])}
+                elif isinstance(dish.get('_id'), ObjectId):
+                    update["$setOnInsert"] = {"_id": dish['_id']}
+                operations.append(UpdateOne({"name": dish['name'], "country": dish['country']}, update, upsert=True))
+
+            if operations:
+                result = self.db.dishes.bulk_write(operations, ordered=False)
+                stats["inserted"] += result.upserted_count
+                stats["updated"] += result.modified_count
+                # Matched but byte-identical documents count as unchanged
+                stats["unchanged"] += len(operations) - result.upserted_count - result.modified_count
+            stats["processed"] += len(batch)
+
+            elapsed = time.perf_counter() - started
+            logger.info("Seeded %d dishes (%.0f dishes/s)", stats['processed'], stats['processed'] / elapsed)
+
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = round(elapsed, 3)
+        stats["dishes_per_second"] = round(stats["processed"] / elapsed, 1) if elapsed else 0.0
+        if stats["inserted"] or stats["updated"]:
+            self.db.bump_catalog_version()
+        return stats
+
+    def seed_dishes_from_jsonl(self, path, batch_size=1000, force=False):
+        """Upsert dishes streamed from a JSONL file, one dish per line"""
+        return self.seed_dishes(read_jsonl(path), batch_size=batch_size, force=force)
+
     def get_seed_statistics(self):
-        """Get statistics about seed data"""
-        return {
-            "total_countries": get_country_count(),
-            "total_dishes": get_dish_count(),
-            "dishes_per_country": get_dish_count() // get_country_count(),
-            "countries": get_countries()
-        }
+        """Get statistics about seed data (static, so computed once)"""
+        if self._seed_statistics is None:
+            countries = get_countries()
+            dishes = get_dish_count()
+            self._seed_statistics = {
+                "total_countries": len(countries),
+                "total_dishes": dishes,
+                "dishes_per_country": dishes // len(countries),
+                "countries": countries
+            }
+        return dict(self._seed_statistics, countries=list(self._seed_statistics["countries"]))
+
+    def load_user_recipes(self, recipes, batch_size=1000):
+        """Insert saved recipes from any iterable in batches"""
+        loaded = 0
+        for batch in batched(recipes, batch_size):
+            self.db.user_recipes.insert_many(batch, ordered=False)
+            self.db.bump_user_recipes_versions(recipe['user_id'] for recipe in batch)
+            loaded += len(batch)
+            logger.info("Loaded %s saved recipes", loaded)
+        return loaded
@@ -0,0 +1,73 @@
+"""
+GeoDish JSON Serialization
+BSON-aware Flask JSON provider and pre-encoded JSON fragments
+"""
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+import json
+
+
+def json_default(value):
+    """Encode BSON types natively so documents need no _id conversion first"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    return DefaultJSONProvider.default(value)
+
+
+def dumps(obj):
+    """Encode obj the way the app's JSON provider does (sorted keys, compact)"""
+    return json.dumps(obj, default=json_default, sort_keys=True, separators=(',', ':'))
+
+
+class RawJSON(str):
+    """Already encoded JSON, spliced into responses verbatim by encode_document"""
+
+
+def encode_document(document):
+    """Encode a dict, splicing its RawJSON values in without re-encoding them"""
+    raw = {key: value for key, value in document.items() if isinstance(value, RawJSON)}
+    if not raw:
+        return dumps(document)
+    body = dumps({key: value for key, value in document.items() if key not in raw})
+    fragments = ','.join(f'{dumps(key)}:{value}' for key, value in raw.items())
+    return body[:-1] + (',' if body != '{}' else '') + fragments + '}'
+
+
+class GeoDishJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that understands ObjectId"""
+
+    default = staticmethod(json_default)
+
+
+class DishPayloadCache:
+    """Pre-encoded JSON per catalog dish, keyed by dish id.
+
+    Each dish is encoded once and reused until invalidate() drops it (one id
+    on update or delete, everything on reseed). A generation counter keeps an
+    encode that raced with an invalidation from storing the stale payload.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._payloads = {}
+
+    def get(self, dish_id):
+        return self._payloads.get(dish_id)
+
+    def store(self, dish, generation):
+        """Encode dish and cache it unless invalidated since generation was read"""
+        payload = RawJSON(dumps(dish))
+        if generation == self.generation:
+            self._payloads[str(dish['_id'])] = payload
+        return payload
+
+    def invalidate(self, dish_id=None):
+        """Drop one dish's payload, or all of them when dish_id is None"""
+        self.generation += 1
+        if dish_id is None:
+            self._payloads = {}
+        else:
+            self._payloads.pop(str(dish_id), None)
+
+    def __len__(self):
+        return len(self._payloads)
@@ -0,0 +1,124 @@
+"""
+GeoDish Similar Dishes
+Top-k Jaccard neighbours by ingredients, computed from the pantry bitsets
+"""
+import threading
+
+from .pantry import iter_bits
+from .singleflight import acquire
+
+
+class SimilarityIndex:
+    """Nearest-neighbour lists over a PantryMatcher's ingredient bitsets.
+
+    A dish's intersection sizes with every other dish come from one
+    bit-sliced sum of its ingredients' bitsets; grouping by (intersection,
+    size) turns those into Jaccard scores without visiting dishes one by
+    one. Lists are computed on first request (or up front by precompute()),
+    then served from memory. Dish writes patch the affected lists only.
+    """
+
+    def __init__(self, matcher, k=10):
+        self.matcher = matcher
+        self.k = k
+        self._neighbors = {}  # dish_id -> ((neighbor_id, score), ...)
+        self._rebuilds = None
+        self._lock = threading.Lock()
+
+    def neighbors(self, dish_id):
+        """Top-k (dish_id, jaccard) pairs for dish_id from other countries, or None if unknown"""
+        self._check_version()
+        cached = self._neighbors.get(dish_id)
+        if cached is None:
+            with acquire(self.matcher._lock, self.matcher.wait_timeout, "the pantry matcher"):
+                cached = self._compute(dish_id)
+            if cached is not None:
+                self._neighbors[dish_id] = cached
+        return cached
+
+    def precompute(self, batch_size=1000):
+        """Compute every dish's list in batches, yielding the number done after each"""
+        self._check_version()
+        dish_ids = list(self.matcher._slots)
+        for start in range(0, len(dish_ids), batch_size):
+            with acquire(self.matcher._lock, self.matcher.wait_timeout, "the pantry matcher"):
+                for dish_id in dish_ids[start:start + batch_size]:
+                    if dish_id not in self._neighbors:
+                        neighbors = self._compute(dish_id)
+                        if neighbors is not None:
+                            self._neighbors[dish_id] = neighbors
+            yield min(start + batch_size, len(dish_ids))
+
+    def dish_added(self, dish_id):
+        """Offer a new (or changed) dish to the lists it now belongs in"""
+        self._check_version()
+        with acquire(self.matcher._lock, self.matcher.wait_timeout, "the pantry matcher"):
+            self._neighbors.pop(dish_id, None)
+            keys = self.matcher._dish_ingredients.get(dish_id)
+            if keys is None:
+                return
+            size = len(keys)
+            candidates, planes = self.matcher._overlap(keys)
+            candidates &= ~self.matcher._countries.get(self.matcher._dish_countries[dish_id], 0)
+            # Intersections are symmetric, so this dish's counts give its score in every list
+            for other_size, size_bits in self.matcher._by_size.items():
+                for shared in range(1, min(size, other_size) + 1):
+                    mask = size_bits & candidates & self.matcher._count_equals(planes, shared)
+                    score = shared / (size + other_size - shared)
+                    for slot in iter_bits(mask):
+                        other_id = self.matcher._dish_ids[slot]
+                        current = self._neighbors.get(other_id)
+                        if current is not None:
+                            self._neighbors[other_id] = self._insert(current, dish_id, score)
+
+    def dish_removed(self, dish_id):
+        """Drop a dish's list and every list that mentions it (recomputed on next request)"""
+        self._check_version()
+        with self._lock:
+            self._neighbors.pop(dish_id, None)
+            stale = [other_id for other_id, neighbors in list(self._neighbors.items())
+                     if any(neighbor_id == dish_id for neighbor_id, _ in neighbors)]
+            for other_id in stale:
+                del self._neighbors[other_id]
+
+    def _check_version(self):
+        # A full matcher rebuild (new catalog) invalidates every list
+        if self._rebuilds != self.matcher.rebuilds:
+            with self._lock:
+                if self._rebuilds != self.matcher.rebuilds:
+                    self._neighbors = {}
+                    self._rebuilds = self.matcher.rebuilds
+
+    def _insert(self, neighbors, dish_id, score):
+        ranked = [neighbor for neighbor in neighbors if neighbor[0] != dish_id]
+        ranked.append((dish_id, round(score, 4)))
+        ranked.sort(key=lambda neighbor: -neighbor[1])
+        return tuple(ranked[:self.k])
+
+    def _compute(self, dish_id):
+        """Top-k list for dish_id; the caller holds the matcher lock"""
+        matcher = self.matcher
+        keys = matcher._dish_ingredients.get(dish_id)
+        if keys is None:
+            return None
+        size = len(keys)
+        candidates, planes = matcher._overlap(keys)
+        candidates &= ~matcher._countries.get(matcher._dish_countries[dish_id], 0)
+        if not candidates:
+            return ()
+
+        # Every (shared, other size) pair is one Jaccard value; walk them best first
+        pairs = sorted(
+            ((shared / (size + other_size - shared), shared, other_size)
+             for other_size in matcher._by_size
+             for shared in range(1, min(size, other_size) + 1)),
+            reverse=True
+        )
+        neighbors = []
+        for score, shared, other_size in pairs:
+            mask = matcher._by_size[other_size] & candidates & matcher._count_equals(planes, shared)
+            for slot in iter_bits(mask):
+                neighbors.append((matcher._dish_ids[slot], round(score, 4)))
+                if len(neighbors) == self.k:
+                    return tuple(neighbors)
+        return tuple(neighbors)
@@ -0,0 +1,77 @@
+"""
+GeoDish Single-Flight
+Coalesces identical concurrent reads into one call to MongoDB
+"""
+from contextlib import contextmanager
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised when a caller gave up waiting on another caller's in-flight call"""
+
+
+@contextmanager
+def acquire(lock, timeout, description):
+    """Hold lock, waiting at most timeout seconds for it (None waits indefinitely)"""
+    if not lock.acquire(timeout=-1 if timeout is None else timeout):
+        raise SingleFlightTimeout(f"Timed out waiting for {description}")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome.
+
+    The first caller for a key runs fn, later callers wait for it (at most
+    timeout seconds) and get the same result or exception. Results are shared
+    objects, so callers must not mutate them.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not call.done.wait(timeout if timeout is not None else self.timeout):
+                self.timeouts += 1
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"executions": self.executions, "shared": self.shared, "timeouts": self.timeouts}
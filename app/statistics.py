@@ -0,0 +1,81 @@
+"""
+GeoDish Statistics Service
+Keeps a periodically refreshed snapshot of catalog and user statistics
+"""
+from .singleflight import SingleFlightTimeout
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StatisticsService:
+    """Refreshes Database.get_statistics() on a background thread.
+
+    Endpoints read the latest snapshot instead of querying on every request.
+    The thread is started on first use, so it belongs to the process that
+    actually serves traffic. The first snapshot is waited for at most
+    wait_timeout seconds; give it enough to cover MongoDB server selection,
+    so an unreachable database surfaces its own error rather than a timeout.
+    """
+
+    def __init__(self, db, interval=30, wait_timeout=None):
+        self.db = db
+        self.interval = interval
+        self.wait_timeout = wait_timeout
+        self._snapshot = None
+        # Exception of the latest failed refresh, cleared by a successful one
+        self._error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Set once the background thread has made its first refresh attempt
+        self._ready = threading.Event()
+
+    def start(self):
+        """Start the background refresh thread if it is not running yet"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='statistics-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        """Recompute the snapshot now and return it"""
+        started = time.perf_counter()
+        stats = self.db.get_statistics()
+        stats["refreshed_at"] = time.time()
+        stats["refresh_seconds"] = round(time.perf_counter() - started, 4)
+        self._snapshot = stats
+        self._error = None
+        return stats
+
+    def snapshot(self, wait=True):
+        """Latest snapshot; on first use waits for it unless wait is False"""
+        self.start()
+        snapshot = self._snapshot
+        if snapshot is None and wait:
+            if not self._ready.wait(self.wait_timeout):
+                raise SingleFlightTimeout("Timed out waiting for the first statistics snapshot")
+            snapshot = self._snapshot
+            if snapshot is None and self._error is not None:
+                # The background refreshes have failed so far: report why
+                raise self._error
+        if snapshot is None:
+            return None
+        return dict(snapshot, age_seconds=round(time.time() - snapshot["refreshed_at"], 1))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                self._error = e
+                logger.warning("Statistics refresh failed: %s", e)
+            self._ready.set()
+            self._stop.wait(self.interval)
@@ -0,0 +1,35 @@
+"""
+GeoDish production server configuration
+
+    gunicorn -c gunicorn.conf.py app.app:app
+
+Runs WEB_WORKERS processes with WEB_THREADS threads each. The app is imported
+in every worker after the fork (preload_app is off), so each process creates
+its own MongoClient and in-memory caches.
+"""
+from app.config import Config
+
+bind = f"0.0.0.0:{Config.WEB_PORT}"
+workers = Config.WEB_WORKERS
+worker_class = 'gthread'
+threads = Config.WEB_THREADS
+timeout = Config.WEB_TIMEOUT
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+keepalive = Config.WEB_KEEPALIVE
+preload_app = False
+
+# Request logs come from the app (sampled per route, see LOG_* settings)
+accesslog = None
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Start filling the catalog caches; this returns at once so the worker starts heartbeating"""
+    from app.app import warm_up
+    warm_up()
+
+
+def worker_exit(server, worker):
+    from app.app import shut_down
+    shut_down()
@@ -0,0 +1,260 @@
+"""
+GeoDish route-level latency benchmark
+
+Drives the Flask app in-process with a weighted mix of catalog and recipe
+calls (or replays captured traffic) and reports throughput plus p50/p95/p99
+latency per route. Runs against an in-memory MongoDB stand-in by default so
+it works offline; pass --mongo to use MONGODB_URI instead.
+
+    python scripts/benchmark.py --requests 5000 --output baseline.json
+    python scripts/benchmark.py --compare baseline.json
+    python scripts/benchmark.py --replay traffic.jsonl
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+DEFAULT_MIX = "countries=40,dish=30,save=10,list=15,delete=5"
+
+
+def load_app(use_mongo):
+    """Import the Flask app, backed by mongomock unless use_mongo is set"""
+    if use_mongo:
+        from app.app import app, db, seed_manager
+        return app, db, seed_manager
+
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("mongomock is required for the in-memory benchmark: pip install -r requirements-dev.txt")
+    # Left active for the whole run so lazily created clients use it too
+    patch('app.models.MongoClient', mongomock.MongoClient).start()
+    from app.app import app, db, seed_manager
+    return app, db, seed_manager
+
+
+def parse_mix(mix):
+    """Parse 'countries=40,dish=30' into operation weights"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+class Workload:
+    """Generates requests for the synthetic operation mix"""
+
+    def __init__(self, db, users, rng):
+        self.rng = rng
+        self.users = [f"bench-user-{i}" for i in range(users)]
+        self.countries = db.get_countries()
+        self.dish_ids = db.get_all_dish_ids()
+        self.saved = {}  # user_id -> recipe IDs created during the run
+
+    def countries_request(self):
+        return 'GET', '/countries', None
+
+    def dish_request(self):
+        return 'GET', f"/dish/{self.rng.choice(self.countries)}", None
+
+    def save_request(self):
+        user_id = self.rng.choice(self.users)
+        body = {"dishid": self.rng.choice(self.dish_ids)}
+        return 'POST', f"/user/{user_id}/save-dish", body
+
+    def list_request(self):
+        return 'GET', f"/user/{self.rng.choice(self.users)}/recipes/full", None
+
+    def delete_request(self):
+        candidates = [user_id for user_id, recipes in self.saved.items() if recipes]
+        if not candidates:
+            return self.list_request()
+        user_id = self.rng.choice(candidates)
+        recipes = self.saved[user_id]
+        recipe_id = recipes.pop(self.rng.randrange(len(recipes)))
+        return 'DELETE', f"/user/{user_id}/recipes/{recipe_id}", None
+
+    def record(self, method, path, response):
+        """Remember recipes created by save calls so deletes can target them"""
+        if method == 'POST' and response.status_code == 201:
+            user_id = path.split('/')[2]
+            self.saved.setdefault(user_id, []).append(response.get_json()['recipeId'])
+
+
+OPERATIONS = {
+    'countries': Workload.countries_request,
+    'dish': Workload.dish_request,
+    'save': Workload.save_request,
+    'list': Workload.list_request,
+    'delete': Workload.delete_request,
+}
+
+
+def synthetic_requests(workload, weights, count):
+    names = list(weights)
+    values = [weights[name] for name in names]
+    for _ in range(count):
+        name = workload.rng.choices(names, weights=values)[0]
+        yield OPERATIONS[name](workload)
+
+
+def replay_requests(path):
+    """Yield (method, path, body) from a JSONL capture of {"method", "path", "body"} records"""
+    with open(path) as capture:
+        for line in capture:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'path' not in record:
+                continue
+            yield record.get('method', 'GET').upper(), record['path'], record.get('body')
+
+
+def route_name(app, method, path):
+    """Map a request to its route rule so latencies are grouped per endpoint"""
+    adapter = app.url_map.bind('localhost')
+    try:
+        rule, _ = adapter.match(path.split('?')[0], method=method, return_rule=True)
+        return f"{method} {rule.rule}"
+    except Exception:
+        return f"{method} <unmatched>"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run(app, workload, requests, warmup):
+    """Issue requests through the test client and collect latencies per route"""
+    client = app.test_client()
+    latencies = {}
+    statuses = {}
+    started = None
+    for issued, (method, path, body) in enumerate(requests):
+        if issued == warmup:
+            latencies.clear()
+            statuses.clear()
+            started = time.perf_counter()
+        begin = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        elapsed = time.perf_counter() - begin
+
+        route = route_name(app, method, path)
+        latencies.setdefault(route, []).append(elapsed)
+        route_statuses = statuses.setdefault(route, {})
+        route_statuses[response.status_code] = route_statuses.get(response.status_code, 0) + 1
+        if workload is not None:
+            workload.record(method, path, response)
+    duration = time.perf_counter() - started if started is not None else 0.0
+    return latencies, statuses, duration
+
+
+def summarize(latencies, statuses, duration):
+    routes = {}
+    total = 0
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        total += len(values)
+        routes[route] = {
+            "requests": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "statuses": {str(code): count for code, count in sorted(statuses[route].items())}
+        }
+    return {
+        "total_requests": total,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(total / duration, 1) if duration else 0.0,
+        "routes": routes
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"{report['total_requests']} requests in {report['duration_s']}s "
+          f"({report['throughput_rps']} req/s)")
+    header = f"{'route':45} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    if baseline:
+        header += f" {'p50 Δ':>8} {'p95 Δ':>8}"
+    print(header)
+    for route, stats in report['routes'].items():
+        line = (f"{route:45} {stats['requests']:>6} {stats['p50_ms']:>9.3f} "
+                f"{stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+        previous = (baseline or {}).get('routes', {}).get(route)
+        if previous:
+            line += f" {change(previous['p50_ms'], stats['p50_ms']):>8} {change(previous['p95_ms'], stats['p95_ms']):>8}"
+        print(line)
+
+
+def change(old, new):
+    if not old:
+        return 'n/a'
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Synthetic requests to issue')
+    parser.add_argument('--warmup', type=int, default=100, help='Requests excluded from the results')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Operation weights, e.g. countries=40,dish=30')
+    parser.add_argument('--users', type=int, default=50, help='Distinct users in the synthetic mix')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic mix')
+    parser.add_argument('--replay', help='Replay a JSONL traffic capture instead of the synthetic mix')
+    parser.add_argument('--mongo', action='store_true', help='Use MONGODB_URI instead of the in-memory stand-in')
+    parser.add_argument('--output', help='Write the JSON report to this file (use as a baseline)')
+    parser.add_argument('--compare', help='Baseline JSON report to diff against')
+    parser.add_argument('--verbose', action='store_true', help='Keep the app\'s INFO logging enabled')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    app, db, seed_manager = load_app(args.mongo)
+    app.config['TESTING'] = True
+    if not args.mongo:
+        seed_manager.seed_database(force=True)
+
+    if args.replay:
+        workload = None
+        requests = replay_requests(args.replay)
+    else:
+        workload = Workload(db, args.users, random.Random(args.seed))
+        requests = synthetic_requests(workload, parse_mix(args.mix), args.requests + args.warmup)
+
+    latencies, statuses, duration = run(app, workload, requests, args.warmup if not args.replay else 0)
+    report = summarize(latencies, statuses, duration)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
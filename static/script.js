@@ -3,6 +3,8 @@ const API_BASE = '';
 let currentUserId = 'user123';
 let currentDish = null;
 let selectedCountry = null;
+let prefetchedDishes = {};
+const DISH_PREFETCH_SIZE = 5;
 
 // DOM Elements
 let countriesGrid;
@@ -29,9 +31,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Setup event listeners
     setupEventListeners();
     
-    // Initialize components
-    loadCountries();
-    loadUserRecipes();
+    // Initialize components (countries and saved recipes in one round trip)
+    loadInitialData();
     
     // Initialize theme
     initializeTheme();
@@ -154,6 +155,55 @@ function setTheme(theme) {
     }
 }
 
+// Run several API calls in one round trip; resolves to their results in order,
+// each {status, body} as the individual endpoint would have answered
+async function fetchBatch(operations) {
+    const response = await fetch('/batch', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ operations })
+    });
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    const data = await response.json();
+    return data.results;
+}
+
+function batchResultOk(result) {
+    return result && result.status >= 200 && result.status < 300;
+}
+
+// Load countries and the user's recipes together on page load
+async function loadInitialData() {
+    console.log('📡 Loading countries and saved recipes...');
+
+    try {
+        const [countries, recipes] = await fetchBatch([
+            { method: 'GET', path: '/countries' },
+            { method: 'GET', path: `/user/${currentUserId}/recipes/full` }
+        ]);
+
+        if (batchResultOk(countries)) {
+            showCountries(countries.body);
+        } else {
+            loadCountries();
+        }
+        if (batchResultOk(recipes)) {
+            showUserRecipes(recipes.body);
+        } else {
+            displayUserRecipes([]);
+        }
+    } catch (error) {
+        // Fall back to the individual endpoints
+        console.error('❌ Batch load failed:', error);
+        loadCountries();
+        loadUserRecipes();
+    }
+}
+
 // Load and display countries in grid format
 async function loadCountries() {
     console.log('📡 Loading countries...');
@@ -164,19 +214,7 @@ async function loadCountries() {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
         
-        const data = await response.json();
-        console.log('📊 Countries data received:', data);
-        
-        // ✅ FIXED: Handle direct array format from API
-        if (Array.isArray(data)) {
-            // Direct array format: ["Argentina", "Australia"...]
-            displayCountriesGrid(data);
-        } else if (data && data.countries && Array.isArray(data.countries)) {
-            // Nested format: {countries: ["Argentina"...]}
-            displayCountriesGrid(data.countries);
-        } else {
-            throw new Error('Invalid countries data format');
-        }
+        showCountries(await response.json());
         
     } catch (error) {
         console.error('❌ Error loading countries:', error);
@@ -185,6 +223,22 @@ async function loadCountries() {
     }
 }
 
+function showCountries(data) {
+    console.log('📊 Countries data received:', data);
+
+    // ✅ FIXED: Handle direct array format from API
+    if (Array.isArray(data)) {
+        // Direct array format: ["Argentina", "Australia"...]
+        displayCountriesGrid(data);
+    } else if (data && data.countries && Array.isArray(data.countries)) {
+        // Nested format: {countries: ["Argentina"...]}
+        displayCountriesGrid(data.countries);
+    } else {
+        showAlert('Failed to load countries: Invalid countries data format', 'danger');
+        displayCountriesError();
+    }
+}
+
 function displayCountriesGrid(countries) {
     console.log('🌍 Displaying countries grid:', countries);
     
@@ -282,13 +336,14 @@ async function getRandomDishForCountry(country) {
     console.log(`🎲 Getting random dish from ${country}...`);
     
     try {
-        // ✅ FIXED: Match the correct API endpoint
-        const response = await fetch(`/dish/${country}`);
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        // Serve from the prefetched batch, refilling it in one round trip when empty
+        let queue = prefetchedDishes[country];
+        if (!queue || queue.length === 0) {
+            queue = await fetchDishBatch(country);
+            prefetchedDishes[country] = queue;
         }
         
-        const dish = await response.json();
+        const dish = queue.shift();
         console.log('🍽️ Random dish received:', dish);
         displayDish(dish);
         
@@ -298,6 +353,23 @@ async function getRandomDishForCountry(country) {
     }
 }
 
+// Fetch several non-repeating dishes, skipping the one currently shown
+async function fetchDishBatch(country) {
+    const url = `/dish/${encodeURIComponent(country)}?count=${DISH_PREFETCH_SIZE}`;
+    const currentId = currentDish && currentDish.country === country ? currentDish._id : null;
+    
+    let response = await fetch(currentId ? `${url}&exclude=${currentId}` : url);
+    if (response.status === 404 && currentId) {
+        // Only the current dish exists for this country
+        response = await fetch(url);
+    }
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    
+    return await response.json();
+}
+
 // Display dish with image support
 function displayDish(dish) {
     console.log('🍽️ Displaying dish:', dish);
@@ -416,29 +488,33 @@ async function saveCurrentDish() {
             customname: currentDish.name 
         });
         
-        const response = await fetch(`/user/${currentUserId}/save-dish`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
+        // Save and refresh the recipes list in one round trip
+        const [saved, recipes] = await fetchBatch([
+            {
+                method: 'POST',
+                path: `/user/${currentUserId}/save-dish`,
+                body: {
+                    dishid: dishId,
+                    customname: currentDish.name
+                }
             },
-            body: JSON.stringify({
-                dishid: dishId,
-                customname: currentDish.name
-            })
-        });
+            { method: 'GET', path: `/user/${currentUserId}/recipes/full` }
+        ]);
 
-        console.log('📡 Response status:', response.status);
+        console.log('📡 Response status:', saved.status);
 
-        if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.error || `HTTP ${response.status}: ${response.statusText}`);
+        if (!batchResultOk(saved)) {
+            throw new Error((saved.body && saved.body.error) || `HTTP ${saved.status}`);
         }
 
-        const result = await response.json();
-        console.log('✅ Recipe saved successfully:', result);
+        console.log('✅ Recipe saved successfully:', saved.body);
         
         showAlert('Recipe saved successfully! 📖', 'success');
-        loadUserRecipes(); // Refresh the recipes list
+        if (batchResultOk(recipes)) {
+            showUserRecipes(recipes.body);
+        } else {
+            loadUserRecipes();
+        }
         
     } catch (error) {
         console.error('❌ Error saving recipe:', error);
@@ -458,17 +534,7 @@ async function loadUserRecipes() {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
         
-        const data = await response.json();
-        console.log('📊 User recipes received:', data);
-        
-        // ✅ FIXED: Handle direct array format from API
-        if (Array.isArray(data)) {
-            displayUserRecipes(data);
-        } else if (data && data.recipes && Array.isArray(data.recipes)) {
-            displayUserRecipes(data.recipes);
-        } else {
-            displayUserRecipes([]);
-        }
+        showUserRecipes(await response.json());
         
     } catch (error) {
         console.error('❌ Error loading user recipes:', error);
@@ -476,6 +542,19 @@ async function loadUserRecipes() {
     }
 }
 
+function showUserRecipes(data) {
+    console.log('📊 User recipes received:', data);
+
+    // ✅ FIXED: Handle direct array format from API
+    if (Array.isArray(data)) {
+        displayUserRecipes(data);
+    } else if (data && data.recipes && Array.isArray(data.recipes)) {
+        displayUserRecipes(data.recipes);
+    } else {
+        displayUserRecipes([]);
+    }
+}
+
 function displayUserRecipes(recipes) {
     console.log('📖 Displaying user recipes:', recipes);
     
@@ -571,21 +650,26 @@ async function deleteRecipe(recipeId) {
     }
     
     try {
-        const response = await fetch(`/user/${currentUserId}/recipes/${recipeId}`, {
-            method: 'DELETE'
-        });
+        // Delete and reload the recipes list in one round trip
+        const [deleted, recipes] = await fetchBatch([
+            { method: 'DELETE', path: `/user/${currentUserId}/recipes/${recipeId}` },
+            { method: 'GET', path: `/user/${currentUserId}/recipes/full` }
+        ]);
         
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        if (!batchResultOk(deleted)) {
+            throw new Error((deleted.body && deleted.body.error) || `HTTP ${deleted.status}`);
         }
         
-        const result = await response.json();
-        console.log('✅ Recipe deleted successfully:', result);
+        console.log('✅ Recipe deleted successfully:', deleted.body);
         
         showAlert('Recipe deleted successfully!', 'success');
         
-        // Reload user recipes to remove the deleted item
-        loadUserRecipes();
+        // Show the reloaded list without the deleted item
+        if (batchResultOk(recipes)) {
+            showUserRecipes(recipes.body);
+        } else {
+            loadUserRecipes();
+        }
         
     } catch (error) {
         console.error('❌ Error deleting recipe:', error);
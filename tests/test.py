@@ -3,6 +3,7 @@ import sys
 import os
 import json
 from unittest.mock import patch, MagicMock
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from pathlib import Path
 
 # Add project root to path
@@ -10,7 +11,7 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from app.app import app
-from app.models import Database
+from app.models import Database, DishSampler
 
 @pytest.fixture
 def client():
@@ -95,6 +96,22 @@ def test_save_recipe_endpoint(client):
                           content_type='application/json')
     assert response.status_code in [201, 404, 409, 500]
 
+def test_save_duplicate_recipe_returns_409(client):
+    """Test duplicate-key error from the unique index maps to 409"""
+    with patch('app.app.db') as mock_db:
+        mock_db.save_dish_to_user_recipes.side_effect = DuplicateKeyError('duplicate')
+        response = client.post('/user/testuser/save-dish',
+                              data=json.dumps({'dishid': '507f1f77bcf86cd799439011'}),
+                              content_type='application/json')
+    assert response.status_code == 409
+
+def test_bulk_recipes_requires_lists(client):
+    """Test bulk endpoint validates its body"""
+    response = client.post('/user/testuser/recipes/bulk',
+                          data=json.dumps({'save': 'not-a-list'}),
+                          content_type='application/json')
+    assert response.status_code == 400
+
 def test_get_user_recipes(client):
     """Test getting user recipes"""
     response = client.get('/user/testuser/recipes/full')
@@ -104,11 +121,52 @@ def test_get_user_recipes(client):
     else:
         assert response.status_code == 500
 
+def test_get_user_recipes_paginated(client):
+    """Test keyset pagination wraps the page and returns the next cursor"""
+    recipes = [{'_id': f'id{i}', 'custom_name': f'Recipe {i}'} for i in range(3)]
+    with patch('app.app.db') as mock_db:
+        mock_db.iter_user_recipes.return_value = iter(recipes)
+        response = client.get('/user/testuser/recipes/full?limit=2&fields=custom_name')
+        mock_db.iter_user_recipes.assert_called_once_with(
+            'testuser', after=None, limit=3, fields=['custom_name'], encoded_dishes=True,
+            version=mock_db.get_user_recipes_version.return_value)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [recipe['_id'] for recipe in data['recipes']] == ['id0', 'id1']
+    assert data['next_after'] == 'id1'
+
+def test_recipes_conditional_get_skips_query(client):
+    """Test a matching If-None-Match gets a 304 without reading recipes"""
+    with patch('app.app.db') as mock_db:
+        mock_db.get_user_recipes_version.return_value = 3
+        mock_db.catalog_etag = 'catalog-0'
+        mock_db.iter_user_recipes.return_value = iter([{'_id': 'id0'}])
+        response = client.get('/user/testuser/recipes/full')
+        etag = response.headers['ETag']
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+
+        mock_db.iter_user_recipes.reset_mock()
+        cached = client.get('/user/testuser/recipes/full', headers={'If-None-Match': f'W/{etag}'})
+        assert cached.status_code == 304
+        assert not mock_db.iter_user_recipes.called
+
+        mock_db.get_user_recipes_version.return_value = 4
+        mock_db.iter_user_recipes.return_value = iter([])
+        changed = client.get('/user/testuser/recipes/full', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+
 def test_invalid_country(client):
     """Test invalid country"""
     response = client.get('/dish/InvalidCountryXYZ123')
     assert response.status_code in [404, 500]
 
+def test_random_dish_invalid_count(client):
+    """Test random dish endpoint rejects a bad count"""
+    response = client.get('/dish/Italy?count=abc')
+    assert response.status_code == 400
+    response = client.get('/dish/Italy?count=0')
+    assert response.status_code == 400
+
 def test_invalid_endpoint(client):
     """Test invalid endpoint returns 404"""
     response = client.get('/invalid/endpoint/that/does/not/exist')
@@ -126,6 +184,18 @@ def test_app_config():
     assert app is not None
     assert hasattr(app, 'config')
 
+def share_catalog_version(db, version=0):
+    """Back the metadata collection mock with a counter, like the shared catalog version document"""
+    shared = {'version': version}
+
+    def bump(*args, **kwargs):
+        shared['version'] += 1
+        return dict(shared)
+
+    db.metadata.find_one.side_effect = lambda *args, **kwargs: dict(shared)
+    db.metadata.find_one_and_update.side_effect = bump
+    return shared
+
 @patch('app.models.MongoClient')
 def test_database_connection_mock(mock_mongo):
     """Test database connection (mocked)"""
@@ -135,5 +205,631 @@ def test_database_connection_mock(mock_mongo):
     assert db is not None
     assert hasattr(db, 'client')
 
+@patch('app.models.MongoClient')
+def test_database_client_is_lazy_and_per_process(mock_mongo):
+    """Test MongoClient is created on first use and recreated after a fork"""
+    db = Database()
+    mock_mongo.assert_not_called()
+    first = db.client
+    assert db.client is first
+    assert mock_mongo.call_count == 1
+    with patch('app.models.os.getpid', return_value=-1):
+        db.client
+    assert mock_mongo.call_count == 2
+
+@patch('app.models.MongoClient')
+def test_catalog_cache_invalidated_by_dish_writes(mock_mongo):
+    """Test catalog reads are cached until the catalog version changes"""
+    db = Database()
+    share_catalog_version(db)
+    db.dishes.aggregate.return_value = [
+        {'_id': 'Italy', 'count': 5},
+        {'_id': 'France', 'count': 3}
+    ]
+    assert db.get_countries() == ['France', 'Italy']
+    assert db.get_total_dish_count() == 8
+    assert db.get_country_dish_counts() == {'Italy': 5, 'France': 3}
+    assert db.dishes.aggregate.call_count == 1
+
+    db.create_dish({'name': 'Pasta', 'country': 'Italy'})
+    db.get_countries()
+    assert db.dishes.aggregate.call_count == 2
+
+@patch('app.models.MongoClient')
+def test_ensure_indexes_removes_duplicate_recipes_first(mock_mongo):
+    """Test a unique index build that fails on old duplicate recipes dedupes them and retries"""
+    from bson import ObjectId
+    from pymongo.errors import OperationFailure
+    db = Database()
+    first, second, third = ObjectId(), ObjectId(), ObjectId()
+    db.user_recipes.aggregate.return_value = [
+        {'_id': {'user_id': 'u1', 'dish_id': 'd1'}, 'ids': [third, first, second], 'count': 3}]
+    db.user_recipes.delete_many.return_value.deleted_count = 2
+    recipe_index_builds = []
+
+    def create_indexes(indexes):
+        if indexes is Database.INDEXES['user_recipes']:
+            recipe_index_builds.append(indexes)
+            if len(recipe_index_builds) == 1:
+                raise OperationFailure('duplicate key', code=11000)
+
+    db.db['user_recipes'].create_indexes.side_effect = create_indexes
+    db.ensure_indexes()
+    db.user_recipes.delete_many.assert_called_once_with({'_id': {'$in': [second, third]}})
+    assert len(recipe_index_builds) == 2
+
+    # Seeding dishes only needs the dishes indexes
+    db.ensure_indexes(['dishes'])
+    assert len(recipe_index_builds) == 2
+
+@patch('app.models.MongoClient')
+def test_dish_reads_leave_out_content_hash(mock_mongo):
+    """Test the seeding content hash is projected out of every served dish document"""
+    from bson import ObjectId
+    db = Database()
+    share_catalog_version(db)
+    dish_id = ObjectId()
+    db.dishes.find.return_value = []
+    db.dishes.find_one.return_value = {'_id': dish_id, 'name': 'Pizza', 'country': 'Italy'}
+    assert db.get_dish_by_id(str(dish_id))['name'] == 'Pizza'
+    assert db.dishes.find.call_args[0][1] == {'content_hash': 0}
+    db.dishes.find_one.assert_called_once_with({'_id': dish_id}, {'content_hash': 0})
+    db.get_dishes_by_ids([str(dish_id)])
+    assert db.dishes.find.call_args[0][1] == {'content_hash': 0}
+
+@patch('app.models.MongoClient')
+def test_catalog_writes_reach_other_workers(mock_mongo):
+    """Test a seed in one worker process is picked up by another through the shared catalog version"""
+    worker1, worker2 = Database(), Database()
+    share_catalog_version(worker1)
+    worker2.catalog_check_interval = 0
+    worker1.dishes.aggregate.return_value = []
+    assert worker1.get_countries() == [] and worker2.get_countries() == []
+
+    worker1.dishes.aggregate.return_value = [{'_id': 'Italy', 'count': 5}]
+    worker1.bump_catalog_version()
+    assert worker2.get_countries() == ['Italy']
+    assert worker1.catalog_etag == worker2.catalog_etag
+
+@patch('app.models.MongoClient')
+def test_warm_up_skips_catalog_indexes_for_large_catalogs(mock_mongo):
+    """Test warm-up only loads the snapshot when the catalog exceeds its bound"""
+    db = Database()
+    share_catalog_version(db)
+    db.dishes.aggregate.return_value = [{'_id': 'Italy', 'count': 50}]
+    assert db.warm_up(max_dishes=10) is False
+    db.dishes.find.assert_not_called()
+    db.dishes.find.return_value = []
+    assert db.warm_up(max_dishes=100) is True
+    assert db.dishes.find.called
+
+@patch('app.models.MongoClient')
+def test_cache_filling_dish_reads_use_the_primary(mock_mongo):
+    """Test reloads after a write read dishes from the primary, not a possibly lagging secondary"""
+    from bson import ObjectId
+    handles = {}
+    mock_mongo.return_value.__getitem__.return_value.dishes.with_options.side_effect = \
+        lambda read_preference: handles.setdefault(read_preference.name, MagicMock())
+    db = Database()
+    share_catalog_version(db)
+    dish_id = ObjectId()
+    primary = db.primary_dishes
+    primary.aggregate.return_value = [{'_id': 'Italy', 'count': 1}]
+    primary.find.return_value = [{'_id': dish_id, 'name': 'Pizza', 'country': 'Italy',
+                                  'ingredients': ['flour']}]
+    primary.find_one.return_value = {'_id': dish_id, 'name': 'Pizza', 'country': 'Italy',
+                                     'ingredients': ['flour', 'basil']}
+    assert db.search_dishes('pizza') == (1, [str(dish_id)])
+    assert db.get_countries() == ['Italy']
+    db.bump_catalog_version(dish_id)
+    assert db.search_dishes(ingredients=['basil']) == (1, [str(dish_id)])
+
+    secondary = db.dishes
+    assert secondary is not primary
+    secondary.find.assert_not_called()
+    secondary.find_one.assert_not_called()
+    secondary.aggregate.assert_not_called()
+
+def test_dish_sampler_excludes_and_does_not_repeat():
+    """Test sampler picks distinct dishes and honours exclusions"""
+    sampler = DishSampler()
+    dishes = [{'_id': f'id{i}', 'country': 'Italy', 'name': f'Dish {i}'} for i in range(5)]
+    sampler.refresh(1, lambda: dishes)
+
+    picked = sampler.sample('Italy', count=3, exclude={'id0', 'id1'})
+    ids = [dish['_id'] for dish in picked]
+    assert len(ids) == 3
+    assert len(set(ids)) == 3
+    assert not {'id0', 'id1'} & set(ids)
+    assert len(sampler.sample('Italy', count=10, exclude={'id0'})) == 4
+    assert sampler.sample('Peru') == []
+
+@patch('app.models.MongoClient')
+def test_bulk_update_reports_per_item_status(mock_mongo):
+    """Test bulk save/delete maps write errors back to individual items"""
+    db = Database()
+    share_catalog_version(db)
+    dish_id = '507f1f77bcf86cd799439011'
+    recipe_id = '507f1f77bcf86cd799439012'
+    db.dishes.aggregate.return_value = []
+    db.dishes.find.side_effect = lambda query, *args: (
+        [{'_id': dish_id, 'name': 'Pasta', 'country': 'Italy'}] if '_id' in query else []
+    )
+    db.user_recipes.find.return_value = [{'_id': recipe_id}]
+    db.user_recipes.bulk_write.side_effect = BulkWriteError(
+        {'writeErrors': [{'index': 1, 'code': 11000}]})
+
+    results = db.bulk_update_user_recipes(
+        'testuser',
+        save=[(dish_id, None), (dish_id, None), ('507f1f77bcf86cd799439013', None)],
+        delete=[recipe_id, 'bad-id']
+    )
+    assert [item['status'] for item in results['save']] == ['saved', 'duplicate', 'not_found']
+    assert [item['status'] for item in results['delete']] == ['deleted', 'invalid']
+    assert db.user_recipes.bulk_write.call_count == 1
+
+@patch('app.models.MongoClient')
+def test_reference_recipes_are_hydrated_in_one_lookup(mock_mongo):
+    """Test reference-stored recipes get original_dish from a batched lookup"""
+    db = Database()
+    share_catalog_version(db)
+    db.recipe_storage = Database.RECIPE_STORAGE_REFERENCE
+    dish_id = '507f1f77bcf86cd799439011'
+    db.dishes.find.side_effect = lambda query, *args: (
+        [{'_id': dish_id, 'name': 'Pasta', 'country': 'Italy'}] if '_id' in query else []
+    )
+    db.user_recipes.find.return_value.sort.return_value = [
+        {'_id': f'recipe{i}', 'user_id': 'testuser', 'dish_id': dish_id, 'custom_name': 'Mine'}
+        for i in range(3)
+    ]
+
+    recipes = db.get_user_recipes('testuser')
+    assert [recipe['original_dish']['name'] for recipe in recipes] == ['Pasta'] * 3
+    assert 'original_dish' not in db._build_recipe('testuser', recipes[0]['original_dish'])
+
+@patch('app.models.MongoClient')
+def test_dish_payloads_cached_until_dish_updated(mock_mongo):
+    """Test dish JSON is encoded once and re-encoded only after the dish changes"""
+    from bson import ObjectId
+    from app.serialization import encode_document
+    db = Database()
+    share_catalog_version(db)
+    dish_id = '507f1f77bcf86cd799439011'
+    documents = [{'_id': ObjectId(dish_id), 'name': 'Pasta', 'country': 'Italy'}]
+    db.dishes.find.side_effect = lambda *args: [dict(dish) for dish in documents]
+
+    payload = db.get_random_dish_payloads('Italy')[0]
+    assert json.loads(payload) == {'_id': dish_id, 'name': 'Pasta', 'country': 'Italy'}
+    assert db.get_random_dish_payloads('Italy')[0] is payload
+    assert json.loads(encode_document({'_id': ObjectId(dish_id), 'original_dish': payload})) == {
+        '_id': dish_id, 'original_dish': json.loads(payload)}
+
+    documents[0]['name'] = 'Lasagna'
+    db.dishes.update_one.return_value.modified_count = 1
+    db.update_dish(dish_id, {'name': 'Lasagna'})
+    assert json.loads(db.get_random_dish_payloads('Italy')[0])['name'] == 'Lasagna'
+
+@patch('app.models.MongoClient')
+def test_recipe_cache_write_through_and_eviction(mock_mongo):
+    """Test cached recipe lists follow the user's version, writes and the size limit"""
+    from bson import ObjectId
+    from app.models import RecipeCache
+    db = Database()
+    db.recipe_cache = RecipeCache(max_recipes=3, ttl=60)
+    recipe_id = ObjectId()
+    db.users.find_one.return_value = {'recipes_version': 1}
+    db.user_recipes.find.return_value.sort.return_value = [
+        {'_id': recipe_id, 'user_id': 'u1', 'custom_name': 'Mine', 'original_dish': {'name': 'Pasta'}}
+    ]
+    assert len(db.get_user_recipes('u1')) == 1
+    assert len(db.get_user_recipes('u1')) == 1
+    assert db.user_recipes.find.call_count == 1
+    assert db.recipe_cache.stats()['hits'] == 1
+
+    db.user_recipes.update_one.return_value.modified_count = 1
+    db.users.find_one_and_update.return_value = {'recipes_version': 2}
+    db.update_user_recipe('u1', str(recipe_id), {'custom_name': 'Renamed'})
+    db.users.find_one.return_value = {'recipes_version': 2}
+    assert db.get_user_recipes('u1')[0]['custom_name'] == 'Renamed'
+    assert db.user_recipes.find.call_count == 1
+
+    db.recipe_cache.put('u2', 1, [{'_id': ObjectId()}] * 3)
+    assert db.recipe_cache.stats()['evictions'] == 1
+    assert db.recipe_cache.get('u1', 2) is None
+
+@patch('app.models.MongoClient')
+def test_recipe_cache_save_racing_a_reload(mock_mongo):
+    """Test a save does not add its recipe twice when a reader cached it before the version bump"""
+    from bson import ObjectId
+    db = Database()
+    db.get_dish_by_id = MagicMock(return_value={'_id': 'd1', 'name': 'Pasta'})
+    db.users.find_one.return_value = {'recipes_version': 1}
+    stored = []
+    db.user_recipes.find.return_value.sort.side_effect = lambda *args: list(stored)
+
+    def insert_one(recipe):
+        recipe['_id'] = ObjectId()
+        stored.append(dict(recipe))
+        # A reader misses the cache after the insert but before the bump
+        assert len(db.get_user_recipes('u1')) == 1
+        return MagicMock(inserted_id=recipe['_id'])
+
+    db.user_recipes.insert_one.side_effect = insert_one
+    db.users.find_one_and_update.return_value = {'recipes_version': 2}
+    db.save_dish_to_user_recipes('u1', 'd1')
+    db.users.find_one.return_value = {'recipes_version': 2}
+    assert [recipe['_id'] for recipe in db.get_user_recipes('u1')] == [stored[0]['_id']]
+    assert db.recipe_cache.stats()['hits'] == 1
+
+@patch('app.models.Config.CATALOG_MODE', 'embedded')
+@patch('app.models.MongoClient')
+def test_embedded_catalog_never_queries_dishes(mock_mongo):
+    """Test embedded catalog mode serves dishes from memory"""
+    db = Database()
+    countries = db.get_countries()
+    assert 'Italy' in countries
+    dish = db.get_random_dish_by_country('Italy')
+    assert dish['country'] == 'Italy'
+    assert db.get_dish_by_id(dish['_id'])['name'] == dish['name']
+    assert db.get_dish_by_id('507f1f77bcf86cd799439011') is None
+    assert db.get_total_dish_count() == sum(db.get_country_dish_counts().values())
+    assert not db.dishes.method_calls
+    with pytest.raises(RuntimeError):
+        db.create_dish({'name': 'Pasta', 'country': 'Italy'})
+
+def test_search_index_ranks_prefix_matches_and_updates_incrementally():
+    """Test search tokenizes, prefix-matches, filters and follows dish writes"""
+    from app.search import SearchIndex
+    index = SearchIndex()
+    index.rebuild(0, [
+        {'_id': 'a', 'name': 'Tomato Soup', 'country': 'Italy', 'ingredients': ['tomatoes', 'basil'],
+         'instructions': 'Simmer'},
+        {'_id': 'b', 'name': 'Crème Brûlée', 'country': 'France', 'ingredients': ['cream', 'sugar'],
+         'instructions': 'Bake with tomato garnish'},
+    ])
+    assert index.search('tomat') == (2, ['a', 'b'])
+    assert index.search('creme') == (1, ['b'])
+    assert index.search('tomato', ingredients=['basil']) == (1, ['a'])
+    assert index.search(country='france') == (1, ['b'])
+    assert index.search('tomato', offset=1, limit=1) == (2, ['b'])
+
+    index.add({'_id': 'a', 'name': 'Basil Pesto', 'country': 'Italy', 'ingredients': ['basil']})
+    assert index.search('tomato') == (1, ['b'])
+    index.remove('b')
+    assert index.search('tomato') == (0, [])
+    assert index.search('pesto') == (1, ['a'])
+
+def test_pantry_matcher_ranks_by_missing_ingredients():
+    """Test pantry matching counts matches with bitsets and follows dish writes"""
+    from app.pantry import PantryMatcher
+    matcher = PantryMatcher()
+    matcher.rebuild(0, [
+        {'_id': 'omelette', 'ingredients': ['Eggs', 'butter']},
+        {'_id': 'fried-rice', 'ingredients': ['rice', 'eggs', 'soy sauce', 'scallions']},
+        {'_id': 'salad', 'ingredients': ['lettuce', 'tomatoes']},
+    ])
+    candidates, results = matcher.match(['egg', 'butter', 'rice'])
+    assert candidates == 2
+    assert [(r['dish_id'], r['matched'], r['missing']) for r in results] == [
+        ('omelette', 2, 0), ('fried-rice', 2, 2)]
+    assert results[1]['missing_ingredients'] == ['soy sauce', 'scallions']
+    assert matcher.match(['egg', 'butter', 'rice'], max_missing=1)[1][0]['dish_id'] == 'omelette'
+    assert len(matcher.match(['egg', 'butter', 'rice'], max_missing=1)[1]) == 1
+
+    matcher.remove('omelette')
+    matcher.add({'_id': 'tomato-rice', 'ingredients': ['rice', 'tomato']})
+    assert [r['dish_id'] for r in matcher.match(['rice', 'tomatoes'])[1]] == ['tomato-rice', 'salad', 'fried-rice']
+
+def test_similar_dishes_use_jaccard_across_countries():
+    """Test similar dishes rank by ingredient Jaccard and follow new dishes incrementally"""
+    from app.pantry import PantryMatcher
+    from app.similarity import SimilarityIndex
+    matcher = PantryMatcher()
+    matcher.rebuild(0, [
+        {'_id': 'paella', 'country': 'Spain', 'ingredients': ['rice', 'saffron', 'shrimp', 'peas']},
+        {'_id': 'risotto', 'country': 'Italy', 'ingredients': ['rice', 'saffron', 'butter']},
+        {'_id': 'jambalaya', 'country': 'USA', 'ingredients': ['rice', 'shrimp', 'sausage', 'peas']},
+        {'_id': 'arroz', 'country': 'Spain', 'ingredients': ['rice', 'saffron', 'shrimp', 'peas']},
+    ])
+    similar = SimilarityIndex(matcher, k=2)
+    assert similar.neighbors('paella') == (('jambalaya', 0.6), ('risotto', 0.4))
+    assert similar.neighbors('missing') is None
+
+    matcher.add({'_id': 'clone', 'country': 'Peru', 'ingredients': ['rice', 'saffron', 'shrimp', 'peas']})
+    similar.dish_added('clone')
+    assert similar.neighbors('paella') == (('clone', 1.0), ('jambalaya', 0.6))
+    matcher.remove('clone')
+    similar.dish_removed('clone')
+    assert similar.neighbors('paella')[0] == ('jambalaya', 0.6)
+
+def test_synthetic_data_is_deterministic():
+    """Test synthetic datasets are reproducible and respect the unique index"""
+    import random
+    from app.data.synthetic import SyntheticCatalog, generate_user_recipes, zipf_index
+    rng = random.Random(7)
+    counts = [0] * 5
+    for _ in range(5000):
+        counts[zipf_index(rng, 5)] += 1
+    assert all(counts) and counts == sorted(counts, reverse=True)
+    two_countries = SyntheticCatalog(50, seed=7, num_countries=2)
+    assert {dish['country'] for dish in two_countries.dishes()} == set(two_countries.countries)
+    catalog = SyntheticCatalog(500, seed=7, num_countries=20)
+    assert catalog.dish(42) == SyntheticCatalog(500, seed=7, num_countries=20).dish(42)
+    assert len({dish['_id'] for dish in catalog.dishes()}) == 500
+
+    recipes = list(generate_user_recipes(catalog, 50, seed=7))
+    assert recipes == list(generate_user_recipes(catalog, 50, seed=7))
+    keys = [(recipe['user_id'], recipe['dish_id']) for recipe in recipes]
+    assert len(keys) == len(set(keys))
+
+@patch('app.models.MongoClient')
+def test_seed_dishes_skips_unchanged(mock_mongo):
+    """Test re-seeding only writes new or changed dishes and keeps user recipes"""
+    from app.seed_manager import SeedManager, dish_content_hash
+    db = Database()
+    share_catalog_version(db)
+    unchanged = {'name': 'Pasta', 'country': 'Italy', 'ingredients': ['pasta']}
+    new = {'name': 'Paella', 'country': 'Spain', 'ingredients': ['rice']}
+    db.dishes.find.return_value = [dict(unchanged, content_hash=dish_content_hash(unchanged))]
+    db.dishes.bulk_write.return_value = MagicMock(upserted_count=1, modified_count=0)
+
+    stats = SeedManager(db).seed_dishes([unchanged, new])
+    operations = db.dishes.bulk_write.call_args[0][0]
+    assert len(operations) == 1
+    assert stats['inserted'] == 1
+    assert stats['unchanged'] == 1
+    db.user_recipes.delete_many.assert_not_called()
+
+def test_mongo_command_listener_renders_prometheus_histogram():
+    """Test command events are recorded per collection and rendered as Prometheus text"""
+    from app.metrics import Histogram, MongoCommandListener
+    histogram = Histogram('test_mongo_seconds', 'Test histogram', ('collection', 'command', 'outcome'))
+    listener = MongoCommandListener(histogram)
+    started = MagicMock(command_name='find', command={'find': 'dishes'}, connection_id=1, request_id=7)
+    succeeded = MagicMock(command_name='find', duration_micros=1500, connection_id=1, request_id=7)
+    listener.started(started)
+    listener.succeeded(succeeded)
+
+    text = '\n'.join(histogram.render())
+    assert '# TYPE test_mongo_seconds histogram' in text
+    assert 'test_mongo_seconds_bucket{collection="dishes",command="find",outcome="success",le="0.0025"} 1' in text
+    assert 'test_mongo_seconds_bucket{collection="dishes",command="find",outcome="success",le="0.001"} 0' in text
+    assert 'test_mongo_seconds_count{collection="dishes",command="find",outcome="success"} 1' in text
+
+def test_statistics_service_serves_snapshot():
+    """Test statistics are served from the latest snapshot instead of per request"""
+    from app.statistics import StatisticsService
+    mock_db = MagicMock()
+    mock_db.get_statistics.side_effect = lambda: {'total_dishes': 3, 'total_users': 2}
+    service = StatisticsService(mock_db, interval=3600)
+    try:
+        first = service.snapshot()
+        calls = mock_db.get_statistics.call_count
+        for _ in range(5):
+            assert service.snapshot()['total_dishes'] == 3
+        assert first['total_users'] == 2
+        assert mock_db.get_statistics.call_count == calls
+    finally:
+        service.stop()
+
+@patch('app.models.MongoClient')
+def test_client_is_lazy_and_uses_pool_settings(mock_client):
+    """Test the client connects lazily with pool settings and URI options take precedence"""
+    database = Database('mongodb://db:27017/?serverSelectionTimeoutMS=200', maxPoolSize=7)
+    assert not mock_client.called
+    database.user_recipes.find_one({})
+    _, kwargs = mock_client.call_args
+    assert kwargs['connect'] is False
+    assert kwargs['maxPoolSize'] == 7
+    assert 'serverSelectionTimeoutMS' not in kwargs
+    assert 'socketTimeoutMS' in kwargs
+
+def test_single_flight_shares_one_call():
+    """Test concurrent callers with the same key share one execution and waiters time out"""
+    import threading
+    import time
+    from app.singleflight import SingleFlight, SingleFlightTimeout
+    flights = SingleFlight(timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def slow_query():
+        calls.append(1)
+        release.wait(5)
+        return ['Italy']
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('countries', slow_query)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flights.stats()['shared'] < 4:
+        assert time.monotonic() < deadline, "callers never joined the in-flight call"
+        time.sleep(0.001)
+    with pytest.raises(SingleFlightTimeout):
+        flights.do('countries', slow_query, timeout=0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [['Italy']] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {'executions': 1, 'shared': 5, 'timeouts': 1}
+
+def test_log_pipeline_samples_and_rate_limits():
+    """Test success logs are sampled per route, errors rate limited, and records written as JSON"""
+    import io
+    import logging
+    from app.logs import LogPipeline
+    stream = io.StringIO()
+    pipeline = LogPipeline(route_rates={'GET /health': 0}, error_rate=2, stream=stream)
+    pipeline.start()
+    logger = logging.getLogger('geodish.test')
+    logger.propagate = False
+    logger.addHandler(pipeline.handler)
+    try:
+        with app.test_request_context('/health'):
+            app.preprocess_request()
+            logger.info("healthy %s", "check")
+        with app.test_request_context('/countries'):
+            app.preprocess_request()
+            logger.info("Found %s countries", 3)
+            for i in range(5):
+                logger.error("Error getting countries: %s", i)
+    finally:
+        pipeline.stop()
+        logger.removeHandler(pipeline.handler)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record['message'] for record in records] == [
+        'Found 3 countries', 'Error getting countries: 0', 'Error getting countries: 1']
+    assert records[0]['route'] == '/countries'
+    assert records[0]['method'] == 'GET'
+    assert pipeline.stats()['sampled_out'] == 1
+    assert pipeline.stats()['suppressed'] == 3
+
+def test_build_assets_fingerprints_and_index_served_from_memory(tmp_path):
+    """Test the asset build hashes and rewrites references, and the index page revalidates by ETag"""
+    import gzip
+    from app.assets import build_assets, IndexPage
+    (tmp_path / 'script.js').write_text('// app\nfunction go() {\n    return 1;\n}\n' * 100)
+    (tmp_path / 'style.css').write_text('/* theme */\nbody {\n    color: red;\n}\n')
+    (tmp_path / 'index.html').write_text(
+        '<link href="/static/style.css"><script src="/static/script.js"></script>')
+    manifest = build_assets(str(tmp_path))
+    dist = tmp_path / 'dist'
+    assert (dist / manifest['style.css']).read_text() == 'body{color: red}\n'
+    assert (dist / manifest['script.js']).read_text().startswith('function go() {\nreturn 1;\n}\n')
+    assert gzip.decompress((dist / (manifest['script.js'] + '.gz')).read_bytes()) == \
+        (dist / manifest['script.js']).read_bytes()
+    page = IndexPage(str(tmp_path))
+    assert f'/static/dist/{manifest["script.js"]}'.encode() in page.body
+
+    with patch('app.app.index_page', page):
+        client = app.test_client()
+        response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == page.body
+        assert client.get('/', headers={'If-None-Match': f'"{page.etag}"'}).status_code == 304
+
+    with patch('app.app.static_folder', str(tmp_path)):
+        url = f'/static/dist/{manifest["script.js"]}'
+        response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.mimetype == 'text/javascript'
+        assert 'Accept-Encoding' in response.vary
+        assert 'immutable' in response.headers['Cache-Control']
+        assert gzip.decompress(response.data) == (dist / manifest['script.js']).read_bytes()
+        plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.data == (dist / manifest['script.js']).read_bytes()
+        assert client.get('/static/dist/manifest.json').headers['Cache-Control'] == 'no-cache'
+        assert client.get('/static/dist/../index.html').status_code == 404
+
+def test_signed_request_is_profiled_and_captured(tmp_path):
+    """Test a signed request records stacks and its MongoDB timeline, and the capture is downloadable"""
+    import time
+    from app.profiling import (CaptureStore, ProfileCommandListener, RequestProfiler,
+                               current_capture, sign_profile_token)
+    profiler = RequestProfiler(CaptureStore(str(tmp_path), max_captures=2), slow_ms=0,
+                               secret='s3cret', interval=0.001)
+    token = sign_profile_token('s3cret', time.time() + 60)
+    listener = ProfileCommandListener()
+
+    def slow_countries():
+        event = MagicMock(command_name='aggregate', command={'aggregate': 'dishes'},
+                          connection_id=1, request_id=7, duration_micros=2500)
+        listener.started(event)
+        time.sleep(0.02)
+        listener.succeeded(event)
+        return ['Italy']
+
+    with patch('app.app.profiler', profiler), patch('app.app.db') as mock_db:
+        mock_db.catalog_etag = 'etag'
+        mock_db.get_countries.side_effect = slow_countries
+        client = app.test_client()
+        unsigned = client.get('/countries')
+        unsigned.close()
+        assert 'X-GeoDish-Profile-Id' not in unsigned.headers
+        response = client.get('/countries', headers={'X-GeoDish-Profile': token})
+        response.close()
+        capture_id = response.headers['X-GeoDish-Profile-Id']
+        assert current_capture() is None
+
+        assert client.get('/debug/profiles').status_code == 403
+        listed = client.get('/debug/profiles', headers={'X-GeoDish-Profile': token}).get_json()
+        assert [capture['id'] for capture in listed['captures']] == [capture_id]
+        capture = json.loads(client.get(f'/debug/profiles/{capture_id}',
+                                         headers={'X-GeoDish-Profile': token}).data)
+        assert capture['route'] == '/countries'
+        assert capture['timeline'][0]['collection'] == 'dishes'
+        assert capture['timeline'][0]['duration_ms'] == 2.5
+        assert capture['samples'] > 0
+        assert client.get('/debug/profiles/..', headers={'X-GeoDish-Profile': token}).status_code == 404
+
+def test_profiled_batch_with_a_write_is_captured_as_the_batch(tmp_path):
+    """Test a signed /batch keeps its own profile across a write operation run on the request thread"""
+    import time
+    from app.profiling import CaptureStore, ProfileCommandListener, RequestProfiler, sign_profile_token
+    profiler = RequestProfiler(CaptureStore(str(tmp_path)), slow_ms=0, secret='s3cret', interval=0.001)
+    token = sign_profile_token('s3cret', time.time() + 60)
+    listener = ProfileCommandListener()
+
+    def save(*args, **kwargs):
+        event = MagicMock(command_name='insert', command={'insert': 'user_recipes'},
+                          connection_id=1, request_id=9, duration_micros=1000)
+        listener.started(event)
+        listener.succeeded(event)
+        return 'r1'
+
+    with patch('app.app.profiler', profiler), patch('app.app.db') as mock_db:
+        mock_db.save_dish_to_user_recipes.side_effect = save
+        client = app.test_client()
+        response = client.post('/batch', headers={'X-GeoDish-Profile': token}, json={"operations": [
+            {"method": "POST", "path": "/user/u1/save-dish", "body": {"dishid": "d1"}}
+        ]})
+        response.close()
+        assert response.status_code == 200
+        assert response.get_json()['results'][0]['status'] == 201
+        capture_id = response.headers['X-GeoDish-Profile-Id']
+        capture = json.loads((tmp_path / f"{capture_id}.json").read_text())
+        assert (capture['route'], capture['status']) == ('/batch', 200)
+        assert [entry['collection'] for entry in capture['timeline']] == ['user_recipes']
+        assert len(profiler.store.list()) == 1
+
+def test_batch_runs_operations_through_routes_in_order():
+    """Test /batch returns each operation's status and body in order, writes before later reads"""
+    with patch('app.app.db') as mock_db:
+        mock_db.catalog_etag = 'etag'
+        mock_db.get_countries.return_value = ['Italy', 'Japan']
+        mock_db.save_dish_to_user_recipes.return_value = 'r1'
+        mock_db.get_user_recipes_version.side_effect = lambda user_id: (
+            1 if mock_db.save_dish_to_user_recipes.called else 0)
+        mock_db.iter_user_recipes.side_effect = lambda *args, **kwargs: iter(
+            [{'_id': 'r1', 'name': 'Pizza'}] if mock_db.save_dish_to_user_recipes.called else [])
+        client = app.test_client()
+        response = client.post('/batch', json={"operations": [
+            {"id": "countries", "path": "/countries"},
+            {"method": "POST", "path": "/user/u1/save-dish", "body": {"dishid": "d1"}},
+            {"path": "/user/u1/recipes/full"},
+            {"path": "/nowhere"}
+        ]})
+        assert response.status_code == 200
+        results = response.get_json()['results']
+        assert results[0]['id'] == 'countries'
+        assert results[0]['body'] == ['Italy', 'Japan']
+        assert results[0]['etag']
+        assert results[1]['status'] == 201
+        assert results[1]['body']['recipeId'] == 'r1'
+        assert results[2]['body'] == [{'_id': 'r1', 'name': 'Pizza'}]
+        assert results[3]['status'] == 404
+
+        nested = client.post('/batch', json={"operations": [
+            {"method": "POST", "path": "/batch"},
+            {"method": "POST", "path": "/%62atch"}
+        ]}).get_json()['results']
+        assert [result['status'] for result in nested] == [400, 400]
+        assert nested[1]['body'] == {"error": "Batches cannot be nested"}
+        assert client.post('/batch', json={"operations": [{"path": "/countries"}] * 21}).status_code == 400
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file